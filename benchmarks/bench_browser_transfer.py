@@ -0,0 +1,120 @@
+"""
+Micro-benchmark: getting series data out of the browser as one JSON number
+per point ("json", CHART_DATA_JS) vs base64'd Float64Array bytes ("packed",
+CHART_DATA_PACKED_JS).
+
+    python benchmarks/bench_browser_transfer.py [POINTS_PER_SERIES]
+
+caiso_browser.PACK_VALUES_JS runs under node (V8, like Chrome) on the day in
+fixtures/sample_day.json tiled out to POINTS_PER_SERIES, with some nulls and
+awkward floats mixed in. Both payloads are then decoded the way WebDriver
+hands them to Python and run through caiso_pipeline.normalize; the results
+must be bit-identical. Needs `node` on PATH.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+from caiso_browser import PACK_VALUES_JS, unpack_chart_data  # noqa: E402
+from caiso_pipeline import normalize  # noqa: E402
+
+# What chromedriver does with each script result: JSON.stringify it.
+NODE_SCRIPT = PACK_VALUES_JS + """
+const charts = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+function best(fn) {
+  let ms = Infinity, out;
+  for (let i = 0; i < 5; i++) {
+    const t = process.hrtime.bigint();
+    out = fn();
+    ms = Math.min(ms, Number(process.hrtime.bigint() - t) / 1e6);
+  }
+  return [out, ms];
+}
+const [plain, jsonMs] = best(() => JSON.stringify(charts));
+const [packed, packedMs] = best(() => JSON.stringify(charts.map(c => ({title: c.title, series: c.series.map(s => {
+  const x64 = caisoPack(s.x), y64 = caisoPack(s.y);
+  return x64 === null || y64 === null ? s : {name: s.name, x64: x64, y64: y64};
+})}))));
+process.stdout.write(JSON.stringify({jsonMs, packedMs, plain, packed}));
+"""
+
+
+def make_charts(points):
+    with open(os.path.join(HERE, "fixtures", "sample_day.json"), encoding="utf-8") as f:
+        day = json.load(f)
+    start, step = 1751353200000, day["interval_ms"]
+    x = [start + i * step for i in range(points)]
+    charts = []
+    for chart in day["charts"]:
+        series = []
+        for s in chart["series"]:
+            y = (s["y"] * (points // len(s["y"]) + 1))[:points]
+            y = [v + (i % 7) * 0.1 for i, v in enumerate(y)]  # 0.1-style binary fractions
+            for i in range(0, points, 97):
+                y[i] = None
+            y[1] = 5e-324  # subnormal
+            y[2] = 1.7976931348623157e308
+            series.append({"name": s["name"], "x": x, "y": y})
+        charts.append({"title": chart["title"], "series": series})
+    return charts
+
+
+def timed(fn, repeat=5):
+    """Best-of-`repeat` seconds and traced peak bytes; normalize's cadence log is muted."""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        return _timed(fn, repeat)
+
+
+def _timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, best, peak
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 288 * 31
+    if shutil.which("node") is None:
+        sys.exit("node is needed to run the browser side of this benchmark")
+    charts = make_charts(points)
+    proc = subprocess.run(["node", "-e", NODE_SCRIPT], input=json.dumps(charts),
+                          capture_output=True, text=True, check=True)
+    out = json.loads(proc.stdout)
+    n_series = sum(len(c["series"]) for c in charts)
+    print(f"{n_series} series x {points} points")
+    print(f"{'transfer':<8} {'payload KiB':>12} {'browser ms':>11} {'python ms':>10} {'peak KiB':>9}")
+
+    json_result, json_s, json_peak = timed(lambda: normalize(json.loads(out["plain"])))
+    packed_result, packed_s, packed_peak = timed(lambda: normalize(unpack_chart_data(json.loads(out["packed"]))))
+    for name, payload, js_ms, secs, peak in (
+        ("json", out["plain"], out["jsonMs"], json_s, json_peak),
+        ("packed", out["packed"], out["packedMs"], packed_s, packed_peak),
+    ):
+        print(f"{name:<8} {len(payload) / 1024:>12.0f} {js_ms:>11.1f} {secs * 1000:>10.1f} {peak / 1024:>9.0f}")
+
+    for a, b in zip(json_result, packed_result):
+        for sa, sb in zip(a["series"], b["series"]):
+            assert sa["name"] == sb["name"]
+            for key in ("x", "y"):
+                if not np.array_equal(sa[key].view(np.uint64), sb[key].view(np.uint64)):
+                    sys.exit(f"❌ {a['title']} / {sa['name']}: {key} differs between transfers")
+    print("✅ packed and json results are bit-identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Offline ingest benchmark: the real entry points, no caiso.com, no Google.
+
+    python benchmarks/bench_ingest.py                      # day, month, 3y
+    python benchmarks/bench_ingest.py day month
+    python benchmarks/bench_ingest.py --json now.json      # save results
+    python benchmarks/bench_ingest.py --baseline now.json  # flag regressions, exit 1
+
+Each scenario runs caiso_scraper.py or caiso_backfill_cli.py unchanged (via
+runpy) in its own process, with two things swapped out:
+
+- caiso_extract.fetch_report_html renders fixtures/report_template.html for
+  the requested date from the one-day profile in fixtures/sample_day.json,
+  so the HTML parse, payload shaping and everything after it is real
+  (caiso_extract.probe_report answers for the same pages, with one ETag
+  per date);
+- caiso_sheets.open_spreadsheet returns a fake_gspread.FakeSpreadsheet,
+  which counts every API-shaped call.
+
+Scenarios:
+    day    caiso_scraper.py, one report, empty sheet
+    month  caiso_backfill_cli.py --workers 4, 30 days, empty sheet
+    3y     caiso_backfill_cli.py --workers 4, 3 years into a sheet that
+           already holds the first two (as Sheets displays them, no index
+           tab yet, so the first run has to read and parse every tab)
+    replay caiso_replay.py over a year of saved report pages, one parser
+           process per CPU, empty sheet (no HTTP at all)
+
+Reported: points/s (series values ingested), sheet rows/s, Sheets API
+calls, HTTP fetches and peak RSS of the scenario process, best of a few
+runs for the short scenarios.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+FIXTURES = os.path.join(HERE, "fixtures")
+END_DAY = date(2025, 6, 30)
+
+SCENARIOS = {
+    "day": {"script": "caiso_scraper.py", "days": 1, "preload_days": 0, "repeat": 5},
+    "month": {"script": "caiso_backfill_cli.py", "days": 30, "preload_days": 0, "workers": 4, "repeat": 3},
+    "3y": {"script": "caiso_backfill_cli.py", "days": 3 * 365 + 1, "preload_days": 2 * 365, "workers": 4, "repeat": 1},
+    "replay": {"script": "caiso_replay.py", "days": 365, "preload_days": 0, "workers": None, "repeat": 1},
+}
+
+# a scenario regresses when throughput drops by more than --tolerance (default 20%)
+# or peak memory grows by more than MEMORY_TOLERANCE; any extra Sheets API call counts
+TOLERANCE = 0.20
+MEMORY_TOLERANCE = 0.25
+
+
+# --- FIXTURES ---
+def _load_fixtures():
+    with open(os.path.join(FIXTURES, "report_template.html"), encoding="utf-8") as f:
+        template = f.read()
+    with open(os.path.join(FIXTURES, "sample_day.json"), encoding="utf-8") as f:
+        sample = json.load(f)
+    return template, sample
+
+
+def _local_midnights_ms(day):
+    import pandas as pd
+
+    bounds = pd.DatetimeIndex([datetime.combine(day, datetime.min.time()),
+                               datetime.combine(day + timedelta(days=1), datetime.min.time())])
+    start, end = (int(v) // 1_000_000 for v in bounds.tz_localize("US/Pacific").asi8)
+    return start, end
+
+
+def _day_values(sample, day):
+    """Per chart, per series: the sample profile stretched to the day's length (DST days are 23/25 h)."""
+    start, end = _local_midnights_ms(day)
+    n = (end - start) // sample["interval_ms"]
+    shift = day.toordinal() % 7  # so consecutive days aren't identical
+    return start, [
+        [[series["y"][(i + shift) % len(series["y"])] for i in range(n)] for series in chart["series"]]
+        for chart in sample["charts"]
+    ]
+
+
+def render_report(template, sample, day):
+    start, values = _day_values(sample, day)
+    utc = datetime.utcfromtimestamp(start / 1000)
+    html = template.replace("{{TITLE_DATE}}", day.strftime("%b %d, %Y"))
+    html = html.replace("{{POINT_START}}", f"Date.UTC({utc.year}, {utc.month - 1}, {utc.day}, {utc.hour})")
+    for c, chart in enumerate(values):
+        for s, ys in enumerate(chart):
+            html = html.replace(f"{{{{series:{c}:{s}}}}}", json.dumps(ys, separators=(",", ":")))
+    return html
+
+
+def preload_sheet(spreadsheet, sample, first_day, days):
+    """Chart_N tabs holding `days` of data the way Sheets shows USER_ENTERED writes."""
+    import numpy as np
+    import pandas as pd
+
+    tabs = [[["Timestamp"] + [s["name"] for s in chart["series"]]] for chart in sample["charts"]]
+    cells = {}  # one str per distinct value, or the preloaded sheet alone dominates peak memory
+    for k in range(days):
+        start, values = _day_values(sample, first_day + timedelta(days=k))
+        keys = start + sample["interval_ms"] * np.arange(len(values[0][0]))
+        ts = pd.to_datetime(keys, unit="ms", utc=True).tz_convert("US/Pacific").tz_localize(None)
+        stamps = [f"{t.month}/{t.day}/{t.year} {t.hour}:{t.minute:02d}:{t.second:02d}" for t in ts]
+        for rows, chart in zip(tabs, values):
+            for i, stamp in enumerate(stamps):
+                rows.append([stamp] + [cells.setdefault(ys[i], f"{ys[i]:.15g}") for ys in chart])
+    for c, rows in enumerate(tabs):
+        spreadsheet.add_tab(f"Chart_{c + 1}", rows=len(rows), cols=len(rows[0])).preload(rows)
+
+
+# --- ONE SCENARIO (child process) ---
+def _rss_mib():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run_scenario(name):
+    scenario = SCENARIOS[name]
+    workdir = tempfile.mkdtemp(prefix=f"caiso-bench-{name}-")
+    os.environ.update({
+        "CAISO_CACHE": "0",
+        "CAISO_SPANS_PATH": "",
+        "CAISO_STORE_PATH": os.path.join(workdir, "store.sqlite"),
+        "CAISO_JOURNAL_PATH": os.path.join(workdir, "journal.jsonl"),
+        "CAISO_EXTRACT_MODE": "http",
+        # the fake has no quota; keep the scheduler in the path but never throttle
+        "CAISO_SHEETS_READS_PER_MIN": "0",
+        "CAISO_SHEETS_WRITES_PER_MIN": "0",
+    })
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    import caiso_extract
+    import caiso_metrics
+    import caiso_sheets
+    from fake_gspread import FakeSpreadsheet
+
+    template, sample = _load_fixtures()
+    spreadsheet = FakeSpreadsheet()
+    first_day = END_DAY - timedelta(days=scenario["days"] - 1)
+    if scenario["script"] == "caiso_scraper.py":
+        # the scraper picks its own date (two days ago); the fixture serves any date
+        first_day = (datetime.utcnow() - timedelta(days=2)).date()
+    if scenario["preload_days"]:
+        preload_sheet(spreadsheet, sample, first_day, scenario["preload_days"])
+    preloaded_rows = sum(len(ws._rows) for ws in spreadsheet._tabs.values())
+
+    fetched = []
+
+    def fetch_report_html(url, timeout=30):
+        day = datetime.strptime(url.rsplit("report-", 1)[1][:-len(".html")], "%b-%d-%Y").date()
+        fetched.append(day)
+        return render_report(template, sample, day)
+
+    def probe_report(url, etag=None, last_modified=None, timeout=10):
+        day = datetime.strptime(url.rsplit("report-", 1)[1][:-len(".html")], "%b-%d-%Y").date()
+        seen = {"etag": f'"{day.isoformat()}"', "last_modified": None}  # the fixture is fixed per date
+        return ("unchanged" if etag == seen["etag"] else "changed"), seen
+
+    caiso_extract.fetch_report_html = fetch_report_html
+    caiso_extract.probe_report = probe_report
+    caiso_sheets.open_spreadsheet = lambda: spreadsheet
+
+    if scenario["script"] == "caiso_replay.py":
+        reports = os.path.join(workdir, "reports")
+        os.makedirs(reports)
+        for k in range(scenario["days"]):
+            day = first_day + timedelta(days=k)
+            with open(os.path.join(reports, f"{day.isoformat()}.html"), "w", encoding="utf-8") as f:
+                f.write(render_report(template, sample, day))
+
+    argv = [scenario["script"]]
+    if scenario["script"] == "caiso_replay.py":
+        argv += [reports] + (["--workers", str(scenario["workers"])] if scenario["workers"] else [])
+    if scenario["script"] == "caiso_backfill_cli.py":
+        argv += ["--start", first_day.isoformat(), "--end", END_DAY.isoformat(),
+                 "--workers", str(scenario["workers"]), "--pause", "0", "--no-cache",
+                 "--extract-mode", "http"]
+    rss_before = _rss_mib()
+    sys.argv = argv
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            runpy.run_path(os.path.join(ROOT, scenario["script"]), run_name="__main__")
+        except SystemExit:
+            pass
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    stages = caiso_metrics._default.summary()
+    # replay parses in worker processes; its per-date span counts the points it stores
+    points = next((s.rows for stage, s in stages if stage in ("parse_html", "replay")), 0)
+    sheet_rows = sum(len(ws._rows) for ws in spreadsheet._tabs.values() if ws.title.startswith("Chart_"))
+    return {
+        "scenario": name,
+        "days": len(fetched) or scenario["days"],
+        "seconds": round(elapsed, 3),
+        "points": points,
+        "points_per_s": round(points / elapsed, 1),
+        "sheet_rows_written": sheet_rows - preloaded_rows,
+        "sheet_rows_per_s": round((sheet_rows - preloaded_rows) / elapsed, 1),
+        "api_calls": sum(spreadsheet.calls.values()),
+        "api_breakdown": dict(spreadsheet.calls.most_common()),
+        "http_fetches": len(fetched),
+        "peak_rss_mib": round(peak, 1),
+        "setup_rss_mib": round(rss_before, 1),
+        "top_stages": [(stage, round(s.seconds, 3)) for stage, s in stages[:4]],
+    }
+
+
+# --- DRIVER ---
+def _child(name):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name],
+                          stdout=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"scenario {name} failed (exit {proc.returncode})")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _best_of(name):
+    """Short scenarios are noisy; keep the fastest of a few fresh processes."""
+    runs = [_child(name) for _ in range(SCENARIOS[name]["repeat"])]
+    return min(runs, key=lambda r: r["seconds"])
+
+
+def _print_table(results):
+    print(f"{'scenario':<8} {'days':>5} {'seconds':>8} {'points/s':>10} {'rows/s':>9} "
+          f"{'api calls':>9} {'http':>5} {'peak MiB':>9}")
+    for r in results:
+        print(f"{r['scenario']:<8} {r['days']:>5} {r['seconds']:>8.2f} {r['points_per_s']:>10.0f} "
+              f"{r['sheet_rows_per_s']:>9.0f} {r['api_calls']:>9} {r['http_fetches']:>5} {r['peak_rss_mib']:>9.1f}")
+    for r in results:
+        calls = ", ".join(f"{k}={v}" for k, v in r["api_breakdown"].items())
+        stages = ", ".join(f"{k} {v:.2f}s" for k, v in r["top_stages"])
+        print(f"\n{r['scenario']}: {r['points']} points, {r['sheet_rows_written']} sheet rows written")
+        print(f"  api: {calls}")
+        print(f"  slowest stages: {stages}")
+
+
+def _regressions(results, baseline, tolerance=TOLERANCE):
+    found = []
+    base = {r["scenario"]: r for r in baseline}
+    for r in results:
+        b = base.get(r["scenario"])
+        if b is None:
+            continue
+        if r["points_per_s"] < b["points_per_s"] * (1 - tolerance):
+            found.append(f"{r['scenario']}: {r['points_per_s']:.0f} points/s vs {b['points_per_s']:.0f}")
+        if r["api_calls"] > b["api_calls"]:
+            found.append(f"{r['scenario']}: {r['api_calls']} Sheets API calls vs {b['api_calls']}")
+        if r["peak_rss_mib"] > b["peak_rss_mib"] * (1 + MEMORY_TOLERANCE):
+            found.append(f"{r['scenario']}: peak {r['peak_rss_mib']:.0f} MiB vs {b['peak_rss_mib']:.0f}")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved with --json; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Allowed throughput drop against --baseline (0.2 = 20%%); raise it on noisy machines")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child), default=str))
+        sys.exit(0)
+
+    results = [_best_of(name) for name in (args.scenarios or list(SCENARIOS))]
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = _regressions(results, json.load(f), args.tolerance)
+        if found:
+            print("\n❌ Regressions against " + args.baseline)
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {args.baseline}")
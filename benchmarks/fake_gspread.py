@@ -0,0 +1,195 @@
+"""
+In-memory stand-in for the parts of gspread's Spreadsheet / Worksheet API
+the scrapers use, so ingest can be benchmarked without Google.
+
+Every API-shaped method counts one call in FakeSpreadsheet.calls, the way
+each of them would be one HTTP request against the real Sheets API.
+USER_ENTERED values are rendered the way Sheets displays them afterwards
+("2025-07-01 00:05:00" reads back as "7/1/2025 0:05:00", 12.0 as "12"),
+grids have to be grown before writing past them, and the 10M cell
+spreadsheet limit is enforced.
+"""
+import re
+from collections import Counter
+
+import gspread
+
+CELL_LIMIT = 10_000_000
+
+_A1_RE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!]+))!([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+_ISO_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})(?: (\d{2}):(\d{2})(?::(\d{2}))?)?$")
+
+
+def _col_number(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - ord("A") + 1
+    return n
+
+
+def _display(value, value_input_option):
+    """What Sheets hands back from get_all_values() for a written value."""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return f"{value:.15g}"
+    value = str(value)
+    if value_input_option == "USER_ENTERED":
+        m = _ISO_RE.match(value)
+        if m:
+            y, mo, d, h, mi, s = m.groups()
+            if h is None:
+                return f"{int(mo)}/{int(d)}/{y}"
+            return f"{int(mo)}/{int(d)}/{y} {int(h)}:{mi}:{s or '00'}"
+        try:
+            return f"{float(value):.15g}"
+        except ValueError:
+            pass
+    return value
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows, cols, sheet_id):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.row_count = int(rows)
+        self.col_count = int(cols)
+        self.hidden = False
+        self._rows = []
+
+    def _call(self, name):
+        self.spreadsheet.calls[name] += 1
+
+    def _write(self, start_row, values, value_input_option, start_col=1):
+        end = start_row - 1 + len(values)
+        width = start_col - 1 + max((len(r) for r in values), default=0)
+        if end > self.row_count or width > self.col_count:
+            # the real API answers 400 "exceeds grid limits"
+            raise RuntimeError(f"range {start_row}:{end} x {width} exceeds grid limits of {self.title!r}")
+        if len(self._rows) < end:
+            self._rows.extend([] for _ in range(end - len(self._rows)))
+        for i, row in enumerate(values):
+            cells = [_display(v, value_input_option) for v in row]
+            # like the real API, only the range's cells change: those left and right of it are kept
+            old = self._rows[start_row - 1 + i]
+            left = (old[:start_col - 1] + [""] * (start_col - 1 - len(old)))[:start_col - 1]
+            self._rows[start_row - 1 + i] = left + cells + old[start_col - 1 + len(cells):]
+
+    def preload(self, rows):
+        """Fill the tab directly (no API call), e.g. to stand up a large existing sheet."""
+        self._rows = [list(r) for r in rows]
+        self.row_count = max(self.row_count, len(self._rows))
+        self.col_count = max(self.col_count, max((len(r) for r in self._rows), default=0))
+        self.spreadsheet._check_cells()
+
+    def get_all_values(self):
+        self._call("get_all_values")
+        return [list(r) for r in self._rows]
+
+    def update(self, range_name, values, value_input_option="RAW"):
+        self._call("update")
+        m = re.match(r"^([A-Z]+)(\d+)$", range_name)
+        self._write(int(m.group(2)), values, value_input_option)
+
+    def append_rows(self, values, value_input_option="RAW"):
+        self._call("append_rows")
+        self.resize(rows=max(self.row_count, len(self._rows) + len(values)), cols=self.col_count)
+        self._write(len(self._rows) + 1, values, value_input_option)
+
+    def resize(self, rows=None, cols=None):
+        self.row_count = int(rows or self.row_count)
+        self.col_count = int(cols or self.col_count)
+        self.spreadsheet._check_cells()
+
+    def hide(self):
+        self._call("hide")
+        self.hidden = True
+
+
+class FakeSpreadsheet:
+    def __init__(self, title="CAISO Storage Chart Data"):
+        self.title = title
+        self.id = "fake-spreadsheet"
+        self.calls = Counter()
+        self._tabs = {}
+        self._next_id = 0
+
+    def _check_cells(self):
+        cells = sum(ws.row_count * ws.col_count for ws in self._tabs.values())
+        if cells > CELL_LIMIT:
+            raise RuntimeError(f"spreadsheet would have {cells} cells, over the {CELL_LIMIT} limit")
+
+    def _range(self, a1):
+        m = _A1_RE.match(a1)
+        if not m:
+            raise ValueError(f"unsupported range {a1!r}")
+        quoted, bare, col, row, _, end_row = m.groups()
+        title = quoted.replace("''", "'") if quoted is not None else bare
+        return self._tabs[title], _col_number(col), int(row), int(end_row) if end_row else None
+
+    def add_tab(self, title, rows=1000, cols=26):
+        ws = FakeWorksheet(self, title, rows, cols, self._next_id)
+        self._next_id += 1
+        self._tabs[title] = ws
+        self._check_cells()
+        return ws
+
+    # --- gspread.Spreadsheet API ---
+    def worksheet(self, title):
+        self.calls["worksheet"] += 1
+        if title not in self._tabs:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self._tabs[title]
+
+    def worksheets(self):
+        self.calls["worksheets"] += 1
+        return list(self._tabs.values())
+
+    def add_worksheet(self, title, rows, cols):
+        self.calls["add_worksheet"] += 1
+        return self.add_tab(title, rows, cols)
+
+    def fetch_sheet_metadata(self, params=None):
+        self.calls["fetch_sheet_metadata"] += 1
+        return {"sheets": [
+            {"properties": {"title": ws.title, "sheetId": ws.id,
+                            "gridProperties": {"rowCount": ws.row_count, "columnCount": ws.col_count}}}
+            for ws in self._tabs.values()
+        ]}
+
+    def batch_update(self, body):
+        self.calls["batch_update"] += 1
+        by_id = {ws.id: ws for ws in self._tabs.values()}
+        for request in body["requests"]:
+            props = request["updateSheetProperties"]["properties"]
+            grid = props["gridProperties"]
+            by_id[props["sheetId"]].resize(rows=grid.get("rowCount"), cols=grid.get("columnCount"))
+        return {"replies": [{} for _ in body["requests"]]}
+
+    def values_batch_get(self, ranges, params=None):
+        self.calls["values_batch_get"] += 1
+        out = []
+        for a1 in ranges:
+            ws, col, row, end_row = self._range(a1)
+            values = [r[col - 1:col] for r in ws._rows[row - 1:end_row or row]]
+            while values and not (values[-1] and values[-1][0]):
+                values.pop()
+            out.append({"range": a1, "values": values} if values else {"range": a1})
+        return {"valueRanges": out}
+
+    def values_batch_update(self, body):
+        self.calls["values_batch_update"] += 1
+        option = body.get("valueInputOption", "RAW")
+        for data in body["data"]:
+            ws, col, row, _ = self._range(data["range"])
+            ws._write(row, data["values"], option, start_col=col)
+        return {"totalUpdatedRows": sum(len(d["values"]) for d in body["data"])}
+
+    def values_append(self, range_name, params=None, body=None):
+        self.calls["values_append"] += 1
+        ws, _, _, _ = self._range(range_name)
+        values = body["values"]
+        ws.resize(rows=max(ws.row_count, len(ws._rows) + len(values)), cols=ws.col_count)
+        ws._write(len(ws._rows) + 1, values, (params or {}).get("valueInputOption", "RAW"))
+        return {"updates": {"updatedRows": len(values)}}
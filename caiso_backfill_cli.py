@@ -1,129 +1,88 @@
-import json
-import os
-import sys
-import base64
-import time
 import argparse
-import gspread
-import pandas as pd
-from datetime import datetime, timedelta, date
-from oauth2client.service_account import ServiceAccountCredentials
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from contextlib import nullcontext
+from datetime import datetime
+from caiso_browser import BROWSER_MODE, BROWSER_MODES
+from caiso_extract import EXTRACT_MODE, EXTRACT_MODES
+from caiso_journal import JOURNAL_PATH, Journal
+from caiso_metrics import configure as configure_metrics
+from caiso_plan import RECHECK_DAYS
+from caiso_pipeline import PROBE, SYNC_EVERY_DAYS, date_range, run
+from caiso_sheets import PARTITIONS, SHEETS_EXPORT, SHEETS_PARTITION
+from caiso_store import STORE_PATH, TimeSeriesStore
 
 # --- ARGUMENT PARSING ---
 parser = argparse.ArgumentParser()
 parser.add_argument("--start", required=True, help="Start date in YYYY-MM-DD")
 parser.add_argument("--end", required=True, help="End date in YYYY-MM-DD")
+parser.add_argument("--plan", action="store_true",
+                    help="Only print which dates would be scraped or synced, then exit")
+parser.add_argument("--all-dates", action="store_true",
+                    help="Scrape every date in the range, even ones the store already has in full")
+parser.add_argument("--recheck-days", type=int, default=RECHECK_DAYS,
+                    help="Always re-scrape dates this recent, in case CAISO revised them (default 0)")
+parser.add_argument("--no-probe", action="store_true", default=not PROBE,
+                    help="Don't HEAD each report first to skip 404s and reports unchanged since their last ingest")
+parser.add_argument("--resume", action="store_true",
+                    help="Continue an interrupted run: skip every date its checkpoint journal lists as finished")
+parser.add_argument("--journal", default=JOURNAL_PATH,
+                    help="Checkpoint journal of finished dates (default caiso_journal.jsonl, '' to disable)")
+parser.add_argument("--extract-mode", choices=EXTRACT_MODES, default=EXTRACT_MODE,
+                    help="auto = parse report HTML, fall back to Selenium; http = never start a browser; selenium = always")
+parser.add_argument("--browser-mode", choices=BROWSER_MODES, default=BROWSER_MODE,
+                    help="lean = eager load, block images/fonts/CSS/analytics, wait on a chart-load hook; full = old full page load")
+parser.add_argument("--workers", type=int, default=1,
+                    help="Number of dates fetched in parallel, each worker keeps its own browser session")
+parser.add_argument("--prefetch", type=int, default=None,
+                    help="Dates fetched ahead of the one being stored (default: 2 x workers)")
+parser.add_argument("--pause", type=float, default=0,
+                    help="Seconds to wait after each date (Sheets calls are already paced to the API quota)")
+parser.add_argument("--no-cache", action="store_true",
+                    help="Don't read or write the local chart payload cache")
+parser.add_argument("--refresh-cache", action="store_true",
+                    help="Re-fetch every date even if a fresh cached payload exists")
+parser.add_argument("--store", default=STORE_PATH,
+                    help="SQLite file every date is written to first (the system of record)")
+parser.add_argument("--no-sheets", action="store_true", default=not SHEETS_EXPORT,
+                    help="Only update the local store; don't sync the Google Sheet")
+parser.add_argument("--sheets-partition", choices=PARTITIONS, default=SHEETS_PARTITION,
+                    help="none = one Chart_N tab per chart; month / quarter = Chart_N_2025_07 / Chart_N_2025_Q3 tabs")
+parser.add_argument("--no-rollups", action="store_true",
+                    help="Don't recompute the hourly/daily rollups (caiso_rollup.py) for the stored dates")
+parser.add_argument("--sync-every", type=int, default=SYNC_EVERY_DAYS,
+                    help="Push the stored days to Google Sheets every N days")
+parser.add_argument("--spans", default=None,
+                    help="JSON-lines file for per-stage timing spans (default caiso_spans.jsonl, '' to disable)")
+parser.add_argument("--prom-textfile", default=None,
+                    help="Also write per-stage totals in the Prometheus textfile format to this path")
+parser.add_argument("--profile", nargs="?", const="caiso_profile", default=None, metavar="DIR",
+                    help="cProfile + tracemalloc every stage; dump to DIR and print the slowest stage")
 args = parser.parse_args()
+if args.workers < 1:
+    parser.error("--workers must be at least 1")
+if args.sync_every < 1:
+    parser.error("--sync-every must be at least 1")
+
+configure_metrics(spans_path=args.spans, prom_path=args.prom_textfile, profile_dir=args.profile)
 
 START_DATE = datetime.strptime(args.start, "%Y-%m-%d").date()
 END_DATE = datetime.strptime(args.end, "%Y-%m-%d").date()
 
-# --- GOOGLE SHEETS AUTH ---
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds_json = base64.b64decode(os.environ["GOOGLE_SHEETS_KEY_BASE64"]).decode("utf-8")
-creds_dict = json.loads(creds_json)
-creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-client = gspread.authorize(creds)
-spreadsheet = client.open("CAISO Storage Chart Data")
-
-# --- CHROME SETUP (ONCE) ---
-options = Options()
-options.add_argument("--headless")
-options.add_argument("--no-sandbox")
-options.add_argument("--disable-dev-shm-usage")
-driver_dir = ChromeDriverManager().install()
-driver_path = os.path.join(os.path.dirname(driver_dir), "chromedriver")
-if not os.path.isfile(driver_path):
-    raise FileNotFoundError(f"Expected chromedriver binary not found at: {driver_path}")
-os.chmod(driver_path, 0o755)
-
-# --- LOOP THROUGH EACH DATE ---
-for TARGET_DATE in [START_DATE + timedelta(days=n) for n in range((END_DATE - START_DATE).days + 1)]:
-    print(f"\n📅 Processing: {TARGET_DATE}")
-    WEB_URL = f"https://www.caiso.com/documents/daily-energy-storage-report-{TARGET_DATE.strftime('%b-%d-%Y').lower()}.html"
-
-    driver = None
-    try:
-        service = Service(executable_path=driver_path)
-        driver = webdriver.Chrome(service=service, options=options)
-        driver.get(WEB_URL)
-
-        if "404" in driver.title.lower() or "page not found" in driver.page_source.lower():
-            print(f"❌ Report not found for {TARGET_DATE} — 404 page.")
-            continue
-
-        for _ in range(10):
-            try:
-                is_ready = driver.execute_script("return typeof Highcharts !== 'undefined' && Highcharts.charts[0] !== undefined;")
-                if is_ready:
-                    break
-            except:
-                pass
-            time.sleep(1)
-        else:
-            print("❌ Highcharts not found. Skipping.")
-            continue
-
-        chart_data = driver.execute_script("""
-            return Highcharts.charts.map(function(chart) {
-                return {
-                    title: chart.title ? chart.title.textStr : null,
-                    series: chart.series.map(function(s) {
-                        return {
-                            name: s.name,
-                            data: s.data.map(function(d) {
-                                return { x: d.x, y: d.y };
-                            })
-                        };
-                    })
-                };
-            });
-        """)
-
-        if not chart_data:
-            print("❌ No chart data found.")
-            continue
-
-        for chart_index, chart in enumerate(chart_data):
-            series_list = chart["series"]
-            sheet_title = f"Chart_{chart_index + 1}"
-            if not series_list or not series_list[0]["data"]:
-                print(f"⚠️ Chart {sheet_title} had no data. Skipping.")
-                continue
-
-            datetimes = pd.date_range(start=f"{TARGET_DATE} 00:00", freq="5min", periods=len(series_list[0]["data"]))
-            df = pd.DataFrame({"Timestamp": datetimes})
-            for s in series_list:
-                df[s["name"]] = [point["y"] for point in s["data"]]
-            df["Timestamp"] = df["Timestamp"].astype(str)
-
-            try:
-                sheet = spreadsheet.worksheet(sheet_title)
-            except gspread.exceptions.WorksheetNotFound:
-                sheet = spreadsheet.add_worksheet(title=sheet_title, rows="300", cols="10")
-
-            existing = sheet.get_all_values()
-            if not existing:
-                sheet.append_rows([df.columns.tolist()] + df.values.tolist())
-                print(f"✅ Created new sheet: {sheet_title}")
-            else:
-                existing_timestamps = {row[0] for row in existing[1:]}
-                new_rows = [row for row in df.values.tolist() if row[0] not in existing_timestamps]
-                if new_rows:
-                    sheet.append_rows(new_rows)
-                    print(f"✅ Appended {len(new_rows)} new rows to {sheet_title}.")
-                else:
-                    print(f"⏭️ No new data to append to {sheet_title} — already exists.")
-
-        time.sleep(20)
-
-    except Exception as e:
-        print(f"❌ Failed to process {TARGET_DATE}: {e}")
-        time.sleep(20)
-    finally:
-        if driver:
-            driver.quit()
+# --- PLAN → FETCH → STORE → GOOGLE SHEETS (see caiso_plan.py, caiso_pipeline.py) ---
+# Only dates the store is missing or has incomplete are fetched (unless
+# --all-dates), at most --prefetch ahead, so memory stays flat however long
+# the range is. Every finished date is checkpointed to the journal, which
+# --resume reads back; a plain run starts a fresh one (a --plan never does).
+journal = None
+if args.journal and (args.resume or not args.plan):
+    journal = Journal(args.journal, resume=args.resume)
+with TimeSeriesStore(args.store) as store, journal or nullcontext():
+    run(
+        date_range(START_DATE, END_DATE), store,
+        mode=args.extract_mode, workers=args.workers, prefetch=args.prefetch,
+        use_cache=not args.no_cache, refresh=args.refresh_cache, pause=args.pause,
+        sheets=not args.no_sheets, value_input_option="RAW", sync_every=args.sync_every,
+        browser_mode=args.browser_mode, gaps_only=not args.all_dates,
+        recheck_days=args.recheck_days, dry_run=args.plan, probe=not args.no_probe,
+        sheets_partition=args.sheets_partition, rollups=not args.no_rollups,
+        journal=journal,
+    )
@@ -0,0 +1,515 @@
+import base64
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from caiso_cache import CACHE_DIR
+from caiso_metrics import span
+
+# Pull raw xData/yData for all points (not just visible) for each series
+CHART_DATA_JS = """
+  if (typeof Highcharts !== 'undefined' && Highcharts.charts[0]) {
+    return Highcharts.charts.filter(Boolean).map(function(chart) {
+      return {
+        title: chart.title ? chart.title.textStr : null,
+        series: chart.series.map(function(s) {
+          return {
+            name: s.name,
+            x: (s.xData || []).slice(),   // ms since epoch (UTC)
+            y: (s.yData || []).slice()
+          };
+        })
+      };
+    });
+  } else {
+    return null;
+  }
+"""
+
+# --- SERIES TRANSFER ---
+# "packed" (default): each series' xData/yData leave the browser as base64'd
+# Float64Array bytes (null -> NaN) and are decoded with np.frombuffer, instead
+# of one JSON number per point. Series whose values aren't plain numbers
+# (e.g. [low, high] pairs) still come back as JSON lists.
+# "json": the old path, CHART_DATA_JS.
+TRANSFERS = ("packed", "json")
+TRANSFER = os.environ.get("CAISO_BROWSER_TRANSFER", "packed")
+
+PACK_VALUES_JS = """
+function caisoPack(values) {
+  var n = values.length, buf = new Float64Array(n);
+  for (var i = 0; i < n; i++) {
+    var v = values[i];
+    if (v === null || v === undefined) buf[i] = NaN;
+    else if (typeof v === 'number') buf[i] = v;
+    else return null;
+  }
+  var bytes = new Uint8Array(buf.buffer), chunks = [];
+  for (var j = 0; j < bytes.length; j += 0x8000) {
+    chunks.push(String.fromCharCode.apply(null, bytes.subarray(j, j + 0x8000)));
+  }
+  return btoa(chunks.join(''));
+}
+"""
+
+CHART_DATA_PACKED_JS = PACK_VALUES_JS + """
+  if (typeof Highcharts !== 'undefined' && Highcharts.charts[0]) {
+    return Highcharts.charts.filter(Boolean).map(function(chart) {
+      return {
+        title: chart.title ? chart.title.textStr : null,
+        series: chart.series.map(function(s) {
+          var xs = s.xData || [], ys = s.yData || [];
+          var x64 = caisoPack(xs), y64 = caisoPack(ys);
+          if (x64 === null || y64 === null) {
+            return {name: s.name, x: xs.slice(), y: ys.slice()};
+          }
+          return {name: s.name, x64: x64, y64: y64};
+        })
+      };
+    });
+  } else {
+    return null;
+  }
+"""
+
+HIGHCHARTS_READY_JS = "return typeof Highcharts !== 'undefined' && Highcharts.charts.length > 0"
+
+# --- LEAN PAGE LOADS ---
+# "lean" (default): eager page-load strategy, images/fonts/CSS/analytics
+# blocked, and readiness signalled by a hook on Highcharts' chart load event.
+# "full": the old behaviour, full page load and polling for Highcharts.
+BROWSER_MODES = ("lean", "full")
+BROWSER_MODE = os.environ.get("CAISO_BROWSER_MODE", "lean")
+
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*hotjar.com*", "*newrelic.com*", "*nr-data.net*",
+]
+
+# Runs before any page script: traps the assignment of window.Highcharts and
+# resolves window.__caisoChartsReady on the first chart 'load' event.
+CHARTS_READY_HOOK_JS = """
+(function () {
+  var resolveReady;
+  window.__caisoChartsReady = new Promise(function (resolve) { resolveReady = resolve; });
+  function hook(H) {
+    if (!H || !H.addEvent || !H.Chart || H.__caisoHooked) return;
+    H.__caisoHooked = true;
+    H.addEvent(H.Chart, 'load', function () { resolveReady(true); });
+  }
+  var current = window.Highcharts;
+  hook(current);
+  Object.defineProperty(window, 'Highcharts', {
+    configurable: true,
+    get: function () { return current; },
+    set: function (value) { current = value; try { hook(value); } catch (e) {} }
+  });
+})();
+"""
+
+# Async script: returns true once charts exist, false if the hook is missing.
+# The extra macrotask lets charts created later in the same script finish.
+WAIT_FOR_CHARTS_JS = """
+var done = arguments[arguments.length - 1];
+function settle() { setTimeout(function () { done(true); }, 0); }
+if (typeof Highcharts !== 'undefined' && Highcharts.charts.filter(Boolean).length) { settle(); return; }
+if (!window.__caisoChartsReady) { done(false); return; }
+window.__caisoChartsReady.then(settle);
+"""
+
+NOT_FOUND_JS = """
+var text = document.body ? document.body.innerText.slice(0, 5000) : '';
+return (document.title + ' ' + text).toLowerCase();
+"""
+
+
+def _transfer(transfer):
+    transfer = transfer or TRANSFER
+    if transfer not in TRANSFERS:
+        raise ValueError(f"unknown browser transfer {transfer!r}; expected one of {TRANSFERS}")
+    return transfer
+
+
+def unpack_chart_data(chart_data):
+    """
+    Decode CHART_DATA_PACKED_JS output in place into the usual chart_data
+    shape: x as int64 epoch ms, y as a read-only float64 view of the
+    decoded bytes (NaN where the chart had null).
+    """
+    import numpy as np
+
+    for chart in chart_data:
+        for i, s in enumerate(chart["series"]):
+            if "x64" in s:
+                x = np.frombuffer(base64.b64decode(s["x64"]), dtype="<f8").astype(np.int64)
+                y = np.frombuffer(base64.b64decode(s["y64"]), dtype="<f8")
+                chart["series"][i] = {"name": s["name"], "x": x, "y": y}
+    return chart_data
+
+
+def read_chart_data(driver, transfer=None):
+    """Every Highcharts chart on the page driver is on, via the given transfer."""
+    if _transfer(transfer) == "packed":
+        return unpack_chart_data(driver.execute_script(CHART_DATA_PACKED_JS) or [])
+    return driver.execute_script(CHART_DATA_JS) or []
+
+
+def compare_transfers(driver):
+    """
+    Read the current page both ways and return a list of differences between
+    the normalized packed and JSON results, compared bit for bit (empty when
+    identical).
+    """
+    import numpy as np
+    from caiso_pipeline import normalize
+
+    packed = normalize(read_chart_data(driver, "packed"))
+    plain = normalize(read_chart_data(driver, "json"))
+    if len(packed) != len(plain):
+        return [f"{len(packed)} charts packed vs {len(plain)} as JSON"]
+    problems = []
+    for c, (a, b) in enumerate(zip(packed, plain)):
+        if [s["name"] for s in a["series"]] != [s["name"] for s in b["series"]]:
+            problems.append(f"chart {c}: series names differ")
+            continue
+        for sa, sb in zip(a["series"], b["series"]):
+            for key in ("x", "y"):
+                va, vb = sa[key], sb[key]
+                if va.shape != vb.shape or not np.array_equal(va.view(np.uint64), vb.view(np.uint64)):
+                    problems.append(f"chart {c} {sa['name']!r}: {key} differs")
+    return problems
+
+
+def _mode(mode):
+    mode = mode or BROWSER_MODE
+    if mode not in BROWSER_MODES:
+        raise ValueError(f"unknown browser mode {mode!r}; expected one of {BROWSER_MODES}")
+    return mode
+
+
+def chrome_options(mode=None):
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    if _mode(mode) == "lean":
+        options.page_load_strategy = "eager"  # return at DOMContentLoaded
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    return options
+
+
+def prepare_session(driver):
+    """Block non-essential requests and install the readiness hook (lean mode, Chrome only)."""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": CHARTS_READY_HOOK_JS})
+        return True
+    except Exception as e:
+        print(f"⚠️ Couldn't set up lean page loads ({e.__class__.__name__}); charts will be polled for.")
+        return False
+
+
+# --- CHROMEDRIVER RESOLUTION ---
+# ChromeDriverManager().install() asks the network for the latest driver on
+# every call. Resolve once per process, remember the answer on disk, and
+# only go online when nothing usable is known.
+DRIVER_MEMO = os.path.join(CACHE_DIR, "chromedriver.json")
+_resolve_lock = threading.Lock()
+_resolved = None
+
+
+def _executable(path):
+    return bool(path) and os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def _remembered_chromedriver():
+    try:
+        with open(DRIVER_MEMO, encoding="utf-8") as f:
+            path = json.load(f)["path"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return path if _executable(path) else None
+
+
+def _remember_chromedriver(path):
+    os.makedirs(os.path.dirname(DRIVER_MEMO) or ".", exist_ok=True)
+    tmp = f"{DRIVER_MEMO}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"path": path, "resolved_at": time.time()}, f)
+    os.replace(tmp, DRIVER_MEMO)
+
+
+def forget_chromedriver():
+    """Drop the remembered path, e.g. once Chrome was upgraded past it."""
+    global _resolved
+    with _resolve_lock:
+        _resolved = None
+        try:
+            os.remove(DRIVER_MEMO)
+        except OSError:
+            pass
+
+
+def _download_chromedriver():
+    """
+    webdriver-manager returns a broken path (it points at a notice file next
+    to the binary), so fix it up manually.
+    """
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    with span("chromedriver_install"):
+        driver_dir = ChromeDriverManager().install()
+    driver_path = os.path.join(os.path.dirname(driver_dir), "chromedriver")
+    if not os.path.isfile(driver_path):
+        raise FileNotFoundError(f"Expected chromedriver binary not found at: {driver_path}")
+    os.chmod(driver_path, 0o755)  # fixes the missing executable permission
+    return driver_path
+
+
+def _previously_downloaded_chromedriver():
+    """Newest chromedriver webdriver-manager left in its cache (~/.wdm), if any."""
+    root = os.path.join(os.getcwd(), ".wdm") if os.environ.get("WDM_LOCAL") == "1" else os.path.expanduser("~/.wdm")
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        if "chromedriver" in filenames:
+            path = os.path.join(dirpath, "chromedriver")
+            found.append((os.path.getmtime(path), path))
+    return max(found)[1] if found else None
+
+
+def resolve_chromedriver():
+    """
+    Return a chromedriver path, in order of preference:
+
+    1. CHROMEDRIVER_PATH
+    2. the path this machine resolved last time (DRIVER_MEMO), if still there
+    3. ChromeDriverManager (network), remembered for next time
+    4. offline fallbacks: chromedriver on PATH, then the newest one
+       webdriver-manager downloaded before
+
+    Returns None when all of that fails, which lets Selenium Manager try.
+    """
+    global _resolved
+    with _resolve_lock:
+        if _resolved:
+            return _resolved
+        path = os.environ.get("CHROMEDRIVER_PATH") or _remembered_chromedriver()
+        if not _executable(path):
+            try:
+                path = _download_chromedriver()
+                _remember_chromedriver(path)
+            except Exception as e:
+                path = shutil.which("chromedriver") or _previously_downloaded_chromedriver()
+                print(f"⚠️ Couldn't resolve chromedriver online ({e.__class__.__name__}); "
+                      f"using {path or 'Selenium Manager'}.")
+        _resolved = path
+        return path
+
+
+def new_driver(driver_path=None, mode=None):
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.service import Service
+
+    mode = _mode(mode)
+    path = driver_path or resolve_chromedriver()
+    try:
+        with span("driver_start", mode=mode):
+            driver = webdriver.Chrome(service=Service(executable_path=path), options=chrome_options(mode))
+    except SessionNotCreatedException:
+        if driver_path:
+            raise
+        # most likely a remembered chromedriver that no longer matches Chrome
+        print("⚠️ Chrome rejected the remembered chromedriver; resolving it again.")
+        forget_chromedriver()
+        path = resolve_chromedriver()
+        with span("driver_start", mode=mode):
+            driver = webdriver.Chrome(service=Service(executable_path=path), options=chrome_options(mode))
+    if mode == "lean":
+        prepare_session(driver)
+    return driver
+
+
+def is_not_found_page(driver):
+    return "404" in driver.title.lower() or "page not found" in driver.page_source.lower()
+
+
+def _wait_for_charts(driver, timeout):
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    driver.set_script_timeout(timeout)
+    if driver.execute_async_script(WAIT_FOR_CHARTS_JS):
+        return
+    # no hook on this page (CDP unavailable): fall back to polling
+    WebDriverWait(driver, timeout).until(lambda d: d.execute_script(HIGHCHARTS_READY_JS))
+
+
+def scrape_chart_data(driver, url, timeout=30, mode=None, transfer=None):
+    """
+    Load `url` in `driver` and read every Highcharts chart off the live page.
+    Returns None when the report page is a 404. `mode` must match the one
+    the driver was started with (see new_driver).
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    mode = _mode(mode)
+    with span("page_load", url=url, mode=mode):
+        driver.get(url)
+    if mode == "lean":
+        text = driver.execute_script(NOT_FOUND_JS)
+        if "404" in driver.title.lower() or "page not found" in text:
+            return None
+        with span("highcharts_wait", url=url, mode=mode):
+            _wait_for_charts(driver, timeout)
+    else:
+        if is_not_found_page(driver):
+            return None
+        with span("highcharts_wait", url=url, mode=mode):
+            WebDriverWait(driver, timeout).until(lambda d: d.execute_script(HIGHCHARTS_READY_JS))
+    with span("execute_script", url=url, transfer=_transfer(transfer)) as s:
+        chart_data = read_chart_data(driver, transfer)
+        s["rows"] = sum(len(series["x"]) for chart in chart_data for series in chart["series"])
+    return chart_data
+
+
+class DriverPool:
+    """
+    A bounded pool of long-lived Chrome sessions shared by worker threads.
+
+    Drivers are started lazily, handed out one per thread and reused across
+    dates. A driver that dies mid-scrape is quit and replaced, and the same
+    URL is retried on the fresh session.
+    """
+
+    def __init__(self, size, retries=2, mode=None):
+        self.size = size
+        self.retries = retries
+        self.mode = _mode(mode)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._all = set()
+        self._closed = False
+
+    def _new_driver(self):
+        driver = new_driver(mode=self.mode)
+        with self._lock:
+            self._all.add(driver)
+        return driver
+
+    def warm(self):
+        """Start one session in the background so the first scrape doesn't wait for Chrome."""
+        def start():
+            if not self._slots.acquire(blocking=False):
+                return  # already busy, nothing to warm
+            try:
+                driver = self._new_driver()
+                if self._closed:
+                    self._discard(driver)
+                else:
+                    self._idle.put(driver)
+            except Exception as e:
+                print(f"⚠️ Couldn't pre-start a browser session ({e.__class__.__name__}); will retry on demand.")
+            finally:
+                self._slots.release()
+
+        threading.Thread(target=start, name="driver-warmup", daemon=True).start()
+
+    def _discard(self, driver):
+        with self._lock:
+            self._all.discard(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def driver(self):
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+
+        self._slots.acquire()
+        try:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._new_driver()
+            try:
+                yield driver
+            except TimeoutException:
+                # the page was slow, the session itself is fine
+                self._idle.put(driver)
+                raise
+            except WebDriverException:
+                self._discard(driver)
+                raise
+            except BaseException:
+                self._idle.put(driver)
+                raise
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    def scrape(self, url):
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+
+        for attempt in range(self.retries + 1):
+            try:
+                with self.driver() as driver:
+                    return scrape_chart_data(driver, url, mode=self.mode)
+            except TimeoutException:
+                raise
+            except WebDriverException as e:
+                if attempt == self.retries:
+                    raise
+                print(f"⚠️ Browser session failed on {url} ({e.__class__.__name__}); retrying on a new one.")
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            drivers, self._all = list(self._all), set()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import sys
+    from datetime import date
+
+    if len(sys.argv) != 3 or sys.argv[1] != "verify-transfer":
+        sys.exit("usage: python caiso_browser.py verify-transfer YYYY-MM-DD")
+    from caiso_extract import report_url
+
+    url = report_url(date.fromisoformat(sys.argv[2]))
+    driver = new_driver()
+    try:
+        if scrape_chart_data(driver, url, transfer="json") is None:
+            sys.exit(f"❌ Report not found: {url}")
+        problems = compare_transfers(driver)
+    finally:
+        driver.quit()
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print(f"✅ Packed and JSON transfers are bit-identical for {url}")
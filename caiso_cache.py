@@ -0,0 +1,185 @@
+"""
+On-disk cache of raw per-date chart_data payloads.
+
+Layout under CAISO_CACHE_DIR (default .caiso_cache/):
+
+    objects/<sha256>.json.gz   gzip'd chart_data, named by its content hash
+    index/<YYYY-MM-DD>.json    which object a report date points at, plus
+                               fetch metadata (url, source, fetched_at)
+
+Reports can still be corrected for a few days after they're published, so an
+entry is only trusted forever once it was fetched FINAL_AFTER_DAYS or more
+after its report date. Younger entries expire after RECENT_TTL_HOURS.
+Total object size is capped at CAISO_CACHE_MAX_MB; the least recently used
+dates are evicted first. The total is kept as a running count of object
+bytes, so the index is only scanned once a put takes it over budget.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+CACHE_DIR = os.environ.get("CAISO_CACHE_DIR", ".caiso_cache")
+CACHE_ENABLED = os.environ.get("CAISO_CACHE", "1") != "0"
+FINAL_AFTER_DAYS = int(os.environ.get("CAISO_CACHE_FINAL_AFTER_DAYS", "7"))
+RECENT_TTL_HOURS = float(os.environ.get("CAISO_CACHE_RECENT_TTL_HOURS", "6"))
+MAX_BYTES = int(float(os.environ.get("CAISO_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# an eviction frees down to this share of the cap, so a full cache isn't rescanned on every put
+EVICT_TO = 0.9
+
+
+def _jsonable(o):
+    """numpy arrays (packed browser transfers) as the lists the JSON path returns, NaN as null."""
+    if hasattr(o, "tolist"):
+        return [None if v != v else v for v in o.tolist()]
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
+
+
+def _atomic_write(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class PayloadCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES,
+                 final_after_days=FINAL_AFTER_DAYS, recent_ttl_hours=RECENT_TTL_HOURS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.final_after = timedelta(days=final_after_days)
+        self.recent_ttl = timedelta(hours=recent_ttl_hours)
+        self._objects = os.path.join(root, "objects")
+        self._index = os.path.join(root, "index")
+        self._lock = threading.Lock()
+        self._total = None  # object bytes on disk, counted on first put
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._index, exist_ok=True)
+
+    def _index_path(self, report_date):
+        return os.path.join(self._index, f"{report_date.isoformat()}.json")
+
+    def _object_path(self, digest):
+        return os.path.join(self._objects, f"{digest}.json.gz")
+
+    def meta(self, report_date):
+        try:
+            with open(self._index_path(report_date), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, meta, report_date, now=None):
+        now = now or datetime.now(timezone.utc)
+        fetched_at = datetime.fromisoformat(meta["fetched_at"])
+        report_day = datetime.combine(report_date, datetime.min.time(), tzinfo=timezone.utc)
+        if fetched_at - report_day >= self.final_after:
+            return True  # fetched once the report had settled; it won't change
+        return now - fetched_at < self.recent_ttl
+
+    def get(self, report_date, now=None):
+        """Return the cached chart_data for a date, or None if missing or stale."""
+        meta = self.meta(report_date)
+        if not meta or not self.is_fresh(meta, report_date, now):
+            return None
+        try:
+            with gzip.open(self._object_path(meta["sha256"]), "rb") as f:
+                chart_data = json.loads(f.read().decode("utf-8"))
+        except (OSError, ValueError):
+            return None
+        os.utime(self._index_path(report_date))  # LRU bookkeeping
+        return chart_data
+
+    def put(self, report_date, chart_data, url=None, source=None):
+        raw = json.dumps(chart_data, separators=(",", ":"), sort_keys=True, default=_jsonable).encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        obj = self._object_path(digest)
+        index_path = self._index_path(report_date)
+        meta = {
+            "date": report_date.isoformat(),
+            "sha256": digest,
+            "url": url,
+            "source": source,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            "raw_bytes": len(raw),
+        }
+        # object + index are written under the lock so evict() never sees an
+        # object whose index entry hasn't landed yet
+        with self._lock:
+            if self._total is None:
+                self._total = self._object_bytes()
+            if not os.path.exists(obj):
+                _atomic_write(obj, gzip.compress(raw, compresslevel=6))
+                self._total += os.path.getsize(obj)
+            meta["stored_bytes"] = os.path.getsize(obj)
+            _atomic_write(index_path, json.dumps(meta, indent=1).encode("utf-8"))
+            # objects a re-fetch orphaned still count until evict() sweeps them
+            over = self._total > self.max_bytes
+        if over:
+            self.evict(keep=index_path)
+        return meta
+
+    def _object_bytes(self):
+        return sum(os.path.getsize(os.path.join(self._objects, name))
+                   for name in os.listdir(self._objects) if not name.endswith(".tmp"))
+
+    def evict(self, keep=None):
+        """
+        If the objects don't fit in max_bytes, drop least recently used dates
+        until they fit in EVICT_TO of it.
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self._index):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self._index, name)
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        entries.append((os.path.getmtime(path), path, json.load(f)["sha256"]))
+                except (OSError, ValueError, KeyError):
+                    continue
+            referenced = {digest for _, _, digest in entries}
+            sizes = {}
+            for name in os.listdir(self._objects):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(self._objects, name)
+                digest = name.split(".", 1)[0]
+                if digest not in referenced:
+                    os.remove(path)
+                else:
+                    sizes[digest] = os.path.getsize(path)
+            total = sum(sizes.values())
+            if total <= self.max_bytes:
+                self._total = total
+                return
+            users = {}
+            for _, _, digest in entries:
+                users[digest] = users.get(digest, 0) + 1
+            for _, path, digest in sorted(entries):
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                if path == keep:
+                    continue
+                os.remove(path)
+                users[digest] -= 1
+                if users[digest] == 0 and digest in sizes:
+                    os.remove(self._object_path(digest))
+                    total -= sizes.pop(digest)
+            self._total = total
+
+
+_default = None
+
+
+def default_cache():
+    """The process-wide cache, or None when CAISO_CACHE=0."""
+    global _default
+    if not CACHE_ENABLED:
+        return None
+    if _default is None:
+        _default = PayloadCache()
+    return _default
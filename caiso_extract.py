@@ -0,0 +1,530 @@
+"""
+Browserless extraction of the Highcharts data on CAISO's daily energy storage
+report pages.
+
+The report HTML carries each chart's config inline (``Highcharts.chart(...)``).
+Rather than starting Chrome to run ``Highcharts.charts.map(...)``, we download
+the page over plain HTTP, pull the config object literals out of the scripts
+and rebuild the same chart_data the browser would hand back:
+
+    [{"title": ..., "series": [{"name": ..., "x": [epoch_ms, ...], "y": [...]}]}]
+
+Anything the parser doesn't understand raises ChartParseError, and
+fetch_chart_data() falls back to Selenium for that date.
+
+Run ``python caiso_extract.py saved_report.html`` to check a saved page.
+"""
+import ast
+import calendar
+import json
+import operator
+import os
+import re
+import sys
+import urllib.error
+import urllib.request
+
+from caiso_cache import default_cache
+from caiso_metrics import span
+
+REPORT_URL = "https://www.caiso.com/documents/daily-energy-storage-report-{slug}.html"
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+# "auto" = HTTP parse with Selenium fallback, "http" = never start a browser,
+# "selenium" = always use the browser (the old behaviour)
+EXTRACT_MODES = ("auto", "http", "selenium")
+EXTRACT_MODE = os.environ.get("CAISO_EXTRACT_MODE", "auto")
+
+_CHART_CALL_RE = re.compile(
+    r"(?:new\s+Highcharts\.(?:Chart|StockChart)"
+    r"|Highcharts\.(?:chart|stockChart|mapChart|ganttChart)"
+    r"|\.highcharts)\s*\("
+)
+_IDENT_RE = re.compile(r"^[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*$")
+_NUMBER_RE = re.compile(r"[+-]?(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)")
+_KEY_RE = re.compile(r"[\w$]+")
+_ARITHMETIC_RE = re.compile(r"^[\d\s.eE+\-*/()]+$")
+_BINOPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+_SCRIPT_RE = re.compile(r"<script\b[^>]*>(.*?)</script\s*>", re.S | re.I)
+
+
+class ReportNotFound(Exception):
+    """The report page for a date doesn't exist (404)."""
+
+
+class ChartParseError(ValueError):
+    """The inline chart config couldn't be turned into chart_data."""
+
+
+def report_url(target_date):
+    return REPORT_URL.format(slug=target_date.strftime("%b-%d-%Y").lower())
+
+
+# --- JS OBJECT-LITERAL READER ---
+class _Ref:
+    """A bare identifier in the config (e.g. `data: seriesData`)."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class _Opaque:
+    """An expression we don't evaluate (functions, method calls, ...)."""
+
+    def __init__(self, src):
+        self.src = src
+
+
+class _JSReader:
+    _CONSTANTS = {
+        "true": True,
+        "false": False,
+        "null": None,
+        "undefined": None,
+        "NaN": float("nan"),
+        "Infinity": float("inf"),
+    }
+
+    def __init__(self, src, pos=0):
+        self.src = src
+        self.pos = pos
+
+    def _skip_ws(self):
+        src, n = self.src, len(self.src)
+        while self.pos < n:
+            c = src[self.pos]
+            if c.isspace():
+                self.pos += 1
+            elif src.startswith("//", self.pos):
+                end = src.find("\n", self.pos)
+                self.pos = n if end < 0 else end + 1
+            elif src.startswith("/*", self.pos):
+                end = src.find("*/", self.pos + 2)
+                self.pos = n if end < 0 else end + 2
+            else:
+                break
+
+    def _peek(self):
+        self._skip_ws()
+        return self.src[self.pos] if self.pos < len(self.src) else ""
+
+    def _expect(self, ch):
+        if self._peek() != ch:
+            raise ChartParseError(f"expected {ch!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        c = self._peek()
+        if c == "{":
+            return self._object()
+        if c == "[":
+            return self._array()
+        if c in "\"'`":
+            return self._string()
+        m = _NUMBER_RE.match(self.src, self.pos)
+        if m and (c.isdigit() or c in "+-."):
+            self.pos = m.end()
+            if self._at_value_end():
+                return _to_number(m.group())
+            self.pos = m.start()
+        for word, const in self._CONSTANTS.items():
+            if self.src.startswith(word, self.pos):
+                end = self.pos + len(word)
+                if end >= len(self.src) or not (self.src[end].isalnum() or self.src[end] in "_$"):
+                    self.pos = end
+                    if self._at_value_end():
+                        return const
+                    self.pos -= len(word)
+                    break
+        if self.src.startswith("Date.UTC", self.pos):
+            return self._date_utc()
+        return self._expression()
+
+    def _at_value_end(self):
+        return self._peek() in (",", "}", "]", ")", ";", "")
+
+    def _object(self):
+        self._expect("{")
+        obj = {}
+        while True:
+            c = self._peek()
+            if c == "}":
+                self.pos += 1
+                return obj
+            if c in "\"'`":
+                key = self._string()
+            else:
+                m = _KEY_RE.match(self.src, self.pos)
+                if not m:
+                    raise ChartParseError(f"bad object key at offset {self.pos}")
+                key = m.group()
+                self.pos = m.end()
+            self._expect(":")
+            obj[key] = self.value()
+            if self._peek() == ",":
+                self.pos += 1
+            elif self._peek() != "}":
+                raise ChartParseError(f"expected ',' or '}}' at offset {self.pos}")
+
+    def _array(self):
+        self._expect("[")
+        arr = []
+        while True:
+            c = self._peek()
+            if c == "]":
+                self.pos += 1
+                return arr
+            if c == ",":  # hole
+                arr.append(None)
+                self.pos += 1
+                continue
+            arr.append(self.value())
+            if self._peek() == ",":
+                self.pos += 1
+            elif self._peek() != "]":
+                raise ChartParseError(f"expected ',' or ']' at offset {self.pos}")
+
+    def _string(self):
+        quote = self.src[self.pos]
+        i = self.pos + 1
+        out = []
+        while i < len(self.src):
+            c = self.src[i]
+            if c == quote:
+                self.pos = i + 1
+                return "".join(out)
+            if c == "\\" and i + 1 < len(self.src):
+                nxt = self.src[i + 1]
+                if nxt == "u":
+                    out.append(chr(int(self.src[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                if nxt == "x":
+                    out.append(chr(int(self.src[i + 2:i + 4], 16)))
+                    i += 4
+                    continue
+                out.append({"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "\n": ""}.get(nxt, nxt))
+                i += 2
+                continue
+            if quote == "`" and self.src.startswith("${", i):
+                raise ChartParseError("template literal interpolation is not supported")
+            out.append(c)
+            i += 1
+        raise ChartParseError("unterminated string")
+
+    def _date_utc(self):
+        self.pos += len("Date.UTC")
+        self._expect("(")
+        args = []
+        while self._peek() != ")":
+            arg = self.value()
+            if not isinstance(arg, (int, float)):
+                raise ChartParseError("non-numeric Date.UTC argument")
+            args.append(int(arg))
+            if self._peek() == ",":
+                self.pos += 1
+        self.pos += 1
+        if not args:
+            raise ChartParseError("Date.UTC() needs at least a year")
+        year, month, day, hh, mm, ss, ms = (args + [0, 1, 0, 0, 0, 0][len(args) - 1:])[:7]
+        # JS months are 0-based and may overflow into the next year
+        year, month = year + month // 12, month % 12
+        seconds = calendar.timegm((year, month + 1, 1, hh, mm, ss)) + (day - 1) * 86400
+        return seconds * 1000 + ms
+
+    def _expression(self):
+        """Skip an arbitrary JS expression up to the next top-level delimiter."""
+        start = self.pos
+        depth = 0
+        src, n = self.src, len(self.src)
+        i = self.pos
+        while i < n:
+            c = src[i]
+            if c in "\"'`":
+                self.pos = i
+                self._string()
+                i = self.pos
+                continue
+            if src.startswith("//", i) or src.startswith("/*", i):
+                self.pos = i
+                self._skip_ws()
+                i = self.pos
+                continue
+            if c in "([{":
+                depth += 1
+            elif c in ")]}":
+                if depth == 0:
+                    break
+                depth -= 1
+            elif c in ",;" and depth == 0:
+                break
+            i += 1
+        self.pos = i
+        text = src[start:i].strip()
+        if not text:
+            raise ChartParseError(f"empty expression at offset {start}")
+        if _IDENT_RE.match(text):
+            return _Ref(text)
+        if _ARITHMETIC_RE.match(text):
+            # e.g. `pointInterval: 5 * 60 * 1000`
+            return _eval_arithmetic(ast.parse(text, mode="eval").body)
+        return _Opaque(text)
+
+
+def _eval_arithmetic(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _eval_arithmetic(node.operand)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+        return _BINOPS[type(node.op)](_eval_arithmetic(node.left), _eval_arithmetic(node.right))
+    raise ChartParseError("unsupported arithmetic in chart config")
+
+
+def _to_number(text):
+    if text.lstrip("+-")[:2] in ("0x", "0X"):
+        return int(text, 16)
+    if any(ch in text for ch in ".eE"):
+        return float(text)
+    return int(text)
+
+
+def _find_assignment(html, name):
+    m = re.search(r"(?:\b(?:var|let|const)\s+|(?<![\w$.]))" + re.escape(name) + r"\s*=(?!=)", html)
+    if not m:
+        raise ChartParseError(f"can't resolve JS reference {name!r}")
+    return _JSReader(html, m.end()).value()
+
+
+def _chart_options(scripts):
+    """Yield each chart's options object in document (creation) order."""
+    for m in _CHART_CALL_RE.finditer(scripts):
+        reader = _JSReader(scripts, m.end())
+        options = None
+        while reader._peek() not in (")", ""):
+            arg = reader.value()
+            if isinstance(arg, dict) and options is None:
+                options = arg
+            if reader._peek() == ",":
+                reader.pos += 1
+        if options is None:
+            raise ChartParseError("Highcharts call without an inline options object")
+        yield options
+
+
+def _resolve(value, scripts, depth=0):
+    if isinstance(value, _Ref):
+        if depth > 5:
+            raise ChartParseError(f"reference chain too deep at {value.name!r}")
+        return _resolve(_find_assignment(scripts, value.name), scripts, depth + 1)
+    if isinstance(value, _Opaque):
+        raise ChartParseError(f"can't evaluate JS expression {value.src[:60]!r}")
+    return value
+
+
+def _series_option(series, plot_options, key, default):
+    if key in series:
+        return series[key]
+    for group in (series.get("type"), "series"):
+        if group and isinstance(plot_options.get(group), dict) and key in plot_options[group]:
+            return plot_options[group][key]
+    return default
+
+
+def _series_xy(series, plot_options, scripts):
+    data = _resolve(series.get("data", []), scripts)
+    if not isinstance(data, list):
+        raise ChartParseError("series data is not an array")
+    if _series_option(series, plot_options, "pointIntervalUnit", None):
+        raise ChartParseError("pointIntervalUnit is not supported")
+    x_next = _resolve(_series_option(series, plot_options, "pointStart", 0), scripts)
+    interval = _resolve(_series_option(series, plot_options, "pointInterval", 1), scripts)
+
+    xs, ys = [], []
+    for point in data:
+        point = _resolve(point, scripts)
+        if isinstance(point, list):
+            if len(point) == 2:
+                x, y = point
+            elif len(point) == 1:
+                x, y = x_next, point[0]
+            else:
+                raise ChartParseError("only [x, y] array points are supported")
+        elif isinstance(point, dict):
+            x, y = point.get("x", x_next), point.get("y")
+        else:
+            x, y = x_next, point
+        x, y = _resolve(x, scripts), _resolve(y, scripts)
+        if not isinstance(x, (int, float)) or isinstance(x, bool):
+            raise ChartParseError(f"non-numeric x value {x!r}")
+        if y is not None and (not isinstance(y, (int, float)) or isinstance(y, bool)):
+            raise ChartParseError(f"non-numeric y value {y!r}")
+        xs.append(x)
+        ys.append(y)
+        x_next = x + interval
+    return xs, ys
+
+
+def parse_highcharts_html(html):
+    """Rebuild chart_data from the inline Highcharts configs in a report page."""
+    with span("parse_html", bytes=len(html)) as s:
+        charts = _parse_highcharts_html(html)
+        s["rows"] = sum(len(series["x"]) for chart in charts for series in chart["series"])
+    return charts
+
+
+def _parse_highcharts_html(html):
+    scripts = "\n".join(_SCRIPT_RE.findall(html)) or html
+    charts = []
+    for options in _chart_options(scripts):
+        if "data" in options:
+            raise ChartParseError("charts fed by the Highcharts data module are not supported")
+        plot_options = _resolve(options.get("plotOptions", {}), scripts)
+        title = _resolve(options.get("title", {}), scripts)
+        series_out = []
+        for i, series in enumerate(_resolve(options.get("series", []), scripts)):
+            series = _resolve(series, scripts)
+            xs, ys = _series_xy(series, plot_options, scripts)
+            name = _resolve(series.get("name", f"Series {i + 1}"), scripts)
+            series_out.append({"name": name, "x": xs, "y": ys})
+        charts.append({"title": title.get("text") if isinstance(title, dict) else None, "series": series_out})
+    if not charts:
+        raise ChartParseError("no Highcharts configs found in page")
+    return charts
+
+
+# --- FETCHING ---
+def fetch_report_html(url, timeout=30):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    try:
+        with span("http_fetch", url=url) as s, urllib.request.urlopen(request, timeout=timeout) as resp:
+            charset = resp.headers.get_content_charset() or "utf-8"
+            raw = resp.read()
+            s["bytes"] = len(raw)
+            html = raw.decode(charset, errors="replace")
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            raise ReportNotFound(url) from e
+        raise
+    if re.search(r"<title>[^<]*(?:404|page not found)", html, re.I):
+        raise ReportNotFound(url)
+    return html
+
+
+def probe_report(url, etag=None, last_modified=None, timeout=10):
+    """
+    Cheaply check a report page before extracting it: a HEAD request (or a
+    conditional GET when HEAD isn't allowed) carrying the validators from
+    its last ingest. Returns (state, validators) where state is
+
+        "missing"    404 / 410
+        "unchanged"  304, or the same ETag / Last-Modified as last time
+        "changed"    anything else that answered 200
+        "unknown"    the probe itself failed; extract as usual
+
+    and validators is {"etag", "last_modified"} as the server sent them.
+    """
+    headers = {"User-Agent": USER_AGENT}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    known = {"etag": etag, "last_modified": last_modified}
+    for method in ("HEAD", "GET"):
+        request = urllib.request.Request(url, headers=headers, method=method)
+        try:
+            with span("http_probe", url=url, method=method) as s, \
+                    urllib.request.urlopen(request, timeout=timeout) as resp:
+                s["status"] = resp.status
+                seen = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return "unchanged", {k: e.headers.get(h) or known[k]
+                                     for k, h in (("etag", "ETag"), ("last_modified", "Last-Modified"))}
+            if e.code in (404, 410):
+                return "missing", {}
+            if method == "HEAD" and e.code in (403, 405, 501):
+                continue
+            return "unknown", {}
+        except OSError:
+            return "unknown", {}
+        if etag and seen["etag"]:
+            same = seen["etag"] == etag
+        else:
+            same = bool(last_modified) and seen["last_modified"] == last_modified
+        return ("unchanged" if same else "changed"), seen
+    return "unknown", {}
+
+
+def _scrape_with_browser(url, driver=None, pool=None):
+    import caiso_browser
+
+    if pool is not None:
+        chart_data = pool.scrape(url)
+        if chart_data is None:
+            raise ReportNotFound(url)
+        return chart_data
+    own_driver = driver is None
+    if own_driver:
+        driver = caiso_browser.new_driver()
+    try:
+        chart_data = caiso_browser.scrape_chart_data(driver, url)
+    finally:
+        if own_driver:
+            driver.quit()
+    if chart_data is None:
+        raise ReportNotFound(url)
+    return chart_data
+
+
+def _fetch_uncached(target_date, url, mode, driver, pool):
+    """Return (chart_data, source) straight from CAISO."""
+    if mode == "selenium":
+        return _scrape_with_browser(url, driver, pool), "selenium"
+    try:
+        return parse_highcharts_html(fetch_report_html(url)), "http"
+    except ReportNotFound:
+        raise
+    except (ChartParseError, OSError) as e:
+        if mode == "http":
+            raise
+        print(f"⚠️ Browserless extraction failed for {target_date} ({e}); falling back to Selenium.")
+        return _scrape_with_browser(url, driver, pool), "selenium"
+
+
+def fetch_chart_data(target_date, mode=None, driver=None, pool=None, use_cache=True, refresh=False):
+    """
+    Return chart_data for one report date. Raises ReportNotFound when CAISO
+    has no report for that date.
+
+    A fresh entry in the on-disk payload cache (caiso_cache) is returned
+    without touching the network; `refresh` forces a re-fetch. Otherwise, in
+    "auto" mode the page is parsed over HTTP and Selenium is only started
+    (or `driver` / a session from the caiso_browser.DriverPool `pool` only
+    used) if that fails.
+    """
+    mode = mode or EXTRACT_MODE
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f"unknown extract mode {mode!r}; expected one of {EXTRACT_MODES}")
+    cache = default_cache() if use_cache else None
+    if cache is not None and not refresh:
+        with span("cache_get", date=target_date) as s:
+            chart_data = cache.get(target_date)
+            s["hit"] = chart_data is not None
+        if chart_data is not None:
+            return chart_data
+    url = report_url(target_date)
+    chart_data, source = _fetch_uncached(target_date, url, mode, driver, pool)
+    if cache is not None and chart_data:
+        with span("cache_put", date=target_date):
+            cache.put(target_date, chart_data, url=url, source=source)
+    return chart_data
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8") as f:
+            charts = parse_highcharts_html(f.read())
+        json.dump(charts, sys.stdout)
+        sys.stdout.write("\n")
@@ -0,0 +1,96 @@
+"""
+Append-only checkpoint journal of a backfill, so an interrupted run can be
+resumed without redoing the dates it already finished.
+
+Every unit of work that completes is appended as JSON lines and fsync'd
+before the run moves on:
+
+    {"date": "2025-07-01", "stage": "stored", "chart": "Chart_1", "rows": 1440, "hash": "9f2c..."}
+    {"date": "2025-07-01", "stage": "stored", "chart": null, "rows": 2880, "hash": "41d0..."}
+    {"date": "2025-07-01", "stage": "synced", "chart": null, "rows": 0, "hash": null}
+
+One line per chart (its row count and a hash of its normalized payload),
+then a date-level line that marks the unit complete; a date whose closing
+line never made it to disk (the run died mid-write) counts as not done.
+Stages: stored, synced (pushed to Sheets), not_found and unchanged.
+
+A run without --resume starts a fresh journal; with --resume the previous
+one is read back and extended:
+
+    with Journal(resume=True) as journal:
+        done = journal.completed()   # {date: {stage, ...}}
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from caiso_store import series_hash
+
+JOURNAL_PATH = os.environ.get("CAISO_JOURNAL_PATH", "caiso_journal.jsonl")
+STAGES = ("stored", "synced", "not_found", "unchanged")
+
+
+def chart_hash(chart):
+    """
+    sha256 over a normalized chart's series names and their
+    caiso_store.series_hash, the digest the store dedupes payloads by.
+    """
+    h = hashlib.sha256()
+    for s in chart["series"]:
+        h.update(str(s["name"]).encode("utf-8") + b"\0" + series_hash(s["x"], s["y"]).encode("ascii"))
+    return h.hexdigest()
+
+
+class Journal:
+    def __init__(self, path=JOURNAL_PATH, resume=False):
+        self.path = path
+        self._done = {}
+        if resume and os.path.exists(path):
+            self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of a killed run
+                if entry.get("chart") is None and entry.get("stage") in STAGES:
+                    day = datetime.strptime(entry["date"], "%Y-%m-%d").date()
+                    self._done.setdefault(day, set()).add(entry["stage"])
+
+    def completed(self):
+        """{date: set of stages} finished according to the journal."""
+        return {day: set(stages) for day, stages in self._done.items()}
+
+    def _append(self, entries):
+        self._file.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(self, day, stage, charts=None):
+        """
+        Mark `day` done for `stage`. `charts` is [(chart, rows, hash)] for
+        the per-chart lines; the date-level line carries their totals.
+        """
+        charts = charts or []
+        ts = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        entries = [{"date": day.isoformat(), "stage": stage, "chart": chart, "rows": rows, "hash": digest, "ts": ts}
+                   for chart, rows, digest in charts]
+        combined = hashlib.sha256("".join(d for _, _, d in charts).encode()).hexdigest() if charts else None
+        entries.append({"date": day.isoformat(), "stage": stage, "chart": None,
+                        "rows": sum(rows for _, rows, _ in charts), "hash": combined, "ts": ts})
+        self._append(entries)
+        self._done.setdefault(day, set()).add(stage)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
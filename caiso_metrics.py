@@ -0,0 +1,253 @@
+"""
+Timing spans for every slow stage of a run.
+
+    with span("page_load", date=target_date, url=url):
+        driver.get(url)
+
+    with span("values_batch_update", tab=tab) as s:
+        ...
+        s["rows"] = len(rows)
+
+Each finished span is appended as one JSON line to CAISO_SPANS_PATH
+(default caiso_spans.jsonl; set it to "" to turn the file off) with its
+stage, seconds, thread, parent stage and whatever attributes it carried
+(date, chart, tab, rows, ...). Spans are also totalled per stage for the
+summary table printed at the end of a run and for the optional Prometheus
+textfile (CAISO_PROM_TEXTFILE, for node_exporter's textfile collector).
+
+start_profiling(dir) additionally runs cProfile around every outermost
+span and records each stage's tracemalloc peak (the summary's "peak MiB");
+dump_profile() then writes <dir>/<stage>.pstats for every stage, prints the
+hottest functions of the slowest one, and writes <dir>/tracemalloc.txt: the
+live allocations of the whole process at the end of the run, not per stage.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+SPANS_PATH = os.environ.get("CAISO_SPANS_PATH", "caiso_spans.jsonl")
+PROM_TEXTFILE = os.environ.get("CAISO_PROM_TEXTFILE", "")
+
+
+class _Stage:
+    __slots__ = ("count", "seconds", "max", "rows", "errors", "peak_bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.peak_bytes = 0
+
+
+class Recorder:
+    def __init__(self, path=SPANS_PATH, prom_path=PROM_TEXTFILE):
+        self.path = path
+        self.prom_path = prom_path
+        self.run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + f"-{os.getpid()}"
+        self.stages = {}
+        self.profile_dir = None
+        self._profiles = {}  # (stage, thread id) -> cProfile.Profile
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = None
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _emit(self, record):
+        if not self.path:
+            return
+        line = json.dumps(record, default=str, separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._file.write(line + "\n")
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """Time a block. Yields `attrs` so the block can add e.g. rows= once it knows."""
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        outermost = parent is None
+        profile = None
+        if outermost and self.profile_dir is not None:
+            key = (stage, threading.get_ident())
+            with self._lock:
+                profile = self._profiles.setdefault(key, cProfile.Profile())
+            try:
+                profile.enable()
+            except ValueError:
+                profile = None  # Python 3.12+ allows one active profiler per process
+            if profile is not None and threading.current_thread() is threading.main_thread():
+                tracemalloc.reset_peak()
+        stack.append(stage)
+        error = None
+        started = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            error = e.__class__.__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            peak = None
+            if profile is not None:
+                profile.disable()
+                if threading.current_thread() is threading.main_thread():
+                    peak = tracemalloc.get_traced_memory()[1]
+            with self._lock:
+                entry = self.stages.setdefault(stage, _Stage())
+                entry.count += 1
+                entry.seconds += seconds
+                entry.max = max(entry.max, seconds)
+                entry.rows += int(attrs.get("rows") or 0)
+                entry.errors += error is not None
+                if peak is not None:
+                    entry.peak_bytes = max(entry.peak_bytes, peak)
+            record = {
+                "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "run": self.run_id,
+                "stage": stage,
+                "seconds": round(seconds, 6),
+                "parent": parent,
+                "thread": threading.current_thread().name,
+                **attrs,
+            }
+            if error:
+                record["error"] = error
+            self._emit(record)
+
+    def start_profiling(self, profile_dir):
+        os.makedirs(profile_dir, exist_ok=True)
+        self.profile_dir = profile_dir
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+
+    def summary(self):
+        """[(stage, _Stage)] slowest total first."""
+        with self._lock:
+            return sorted(self.stages.items(), key=lambda kv: kv[1].seconds, reverse=True)
+
+    def print_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        profiling = self.profile_dir is not None
+        header = f"{'stage':<22} {'calls':>6} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'rows':>9} {'errors':>6}"
+        print("\n⏱️ Time per stage")
+        print(header + (f" {'peak MiB':>9}" if profiling else ""))
+        for stage, s in rows:
+            line = (f"{stage:<22} {s.count:>6} {s.seconds:>9.2f} {s.seconds / s.count * 1000:>9.1f} "
+                    f"{s.max * 1000:>9.1f} {s.rows:>9} {s.errors:>6}")
+            if profiling:
+                line += f" {s.peak_bytes / 2**20:>9.1f}" if s.peak_bytes else f" {'':>9}"
+            print(line)
+
+    def write_prometheus(self, path=None):
+        """Write per-stage totals in the Prometheus text format (atomically)."""
+        path = path or self.prom_path
+        if not path:
+            return
+        lines = []
+        metrics = [
+            ("caiso_stage_seconds_total", "counter", "Wall time spent in the stage", lambda s: s.seconds),
+            ("caiso_stage_calls_total", "counter", "Times the stage ran", lambda s: s.count),
+            ("caiso_stage_max_seconds", "gauge", "Slowest single run of the stage", lambda s: s.max),
+            ("caiso_stage_rows_total", "counter", "Rows handled by the stage", lambda s: s.rows),
+            ("caiso_stage_errors_total", "counter", "Runs of the stage that raised", lambda s: s.errors),
+        ]
+        rows = self.summary()
+        for name, kind, help_text, value in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, s in rows:
+                lines.append(f'{name}{{stage="{stage}"}} {value(s)}')
+        lines.append("# HELP caiso_run_finished_timestamp_seconds When the run that wrote this file finished")
+        lines.append("# TYPE caiso_run_finished_timestamp_seconds gauge")
+        lines.append(f"caiso_run_finished_timestamp_seconds {time.time():.0f}")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def dump_profile(self, top=25):
+        """
+        Write <profile_dir>/<stage>.pstats per stage and print the slowest
+        stage's hot spots, then a whole-run tracemalloc snapshot.
+        """
+        if self.profile_dir is None:
+            return None
+        with self._lock:
+            by_stage = {}
+            for (stage, _), profile in self._profiles.items():
+                by_stage.setdefault(stage, []).append(profile)
+        for stage, profiles in list(by_stage.items()):
+            stats = None
+            for profile in profiles:
+                try:
+                    stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+                except TypeError:
+                    continue  # never collected anything
+            if stats is None:
+                del by_stage[stage]
+                continue
+            stats.dump_stats(os.path.join(self.profile_dir, f"{stage}.pstats"))
+        slowest = next((stage for stage, _ in self.summary() if stage in by_stage), None)
+        if slowest is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(os.path.join(self.profile_dir, f"{slowest}.pstats"), stream=out)
+        stats.sort_stats("cumulative").print_stats(top)
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        allocations = "\n".join(str(stat) for stat in snapshot.statistics("lineno")[:top])
+        with open(os.path.join(self.profile_dir, "tracemalloc.txt"), "w", encoding="utf-8") as f:
+            f.write(f"# whole-process snapshot at the end of run {self.run_id}; per-stage peaks are in the summary\n")
+            f.write(allocations + "\n")
+        print(f"\n🔬 Slowest stage: {slowest} — cProfile (cumulative):")
+        print(out.getvalue())
+        print(f"🔬 Live allocations of the whole run at its end, not just {slowest} (top {top}), "
+              f"also in {self.profile_dir}/tracemalloc.txt:")
+        print(allocations)
+        return slowest
+
+    def finish(self):
+        """End-of-run reporting: summary table, Prometheus textfile, profile dump."""
+        self.print_summary()
+        self.write_prometheus()
+        self.dump_profile()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_default = Recorder()
+span = _default.span
+start_profiling = _default.start_profiling
+finish = _default.finish
+
+
+def configure(spans_path=None, prom_path=None, profile_dir=None):
+    """Override the env defaults, e.g. from command-line flags."""
+    if spans_path is not None:
+        _default.path = spans_path
+    if prom_path is not None:
+        _default.prom_path = prom_path
+    if profile_dir is not None:
+        start_profiling(profile_dir)
@@ -0,0 +1,453 @@
+"""
+The scrape pipeline every entry point runs on.
+
+    date source → fetch + extract → normalize → store (dedupe) → Sheets sink
+
+Each stage is a generator pulling from the one before it. Fetching runs on a
+thread pool but never more than `prefetch` dates ahead of the writer, so
+date N+1 is downloading while date N is stored, and memory stays flat no
+matter how long the date range is. The Sheets sink pushes what the store
+has every `sync_every` days instead of once at the very end.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+
+from caiso_browser import DriverPool
+from caiso_cache import default_cache
+from caiso_extract import EXTRACT_MODE, fetch_chart_data, probe_report, report_url, ReportNotFound
+from caiso_journal import chart_hash
+from caiso_metrics import finish, span
+from caiso_store import chart_name, day_bounds_ms, store_chart_data
+
+SYNC_EVERY_DAYS = 31
+# HEAD each report before extracting it (see caiso_extract.probe_report)
+PROBE = os.environ.get("CAISO_PROBE", "1") != "0"
+
+_UNCHANGED = object()
+
+
+# --- DATE SOURCE ---
+def date_range(start, end):
+    """Every day from start to end inclusive, lazily."""
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+# --- FETCH + EXTRACT ---
+def fetch_stage(dates, fetch, workers=1, prefetch=None):
+    """
+    Yield (date, chart_data, error) in date order. `fetch(date)` runs on
+    `workers` threads with at most `prefetch` dates submitted but not yet
+    consumed, so a slow consumer applies back-pressure instead of buffering
+    the whole range.
+    """
+    prefetch = max(prefetch or workers * 2, 1)
+
+    def call(day):
+        try:
+            return fetch(day), None
+        except Exception as e:
+            return None, e
+
+    inflight = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for day in dates:
+            inflight.append((day, executor.submit(call, day)))
+            if len(inflight) >= prefetch:
+                day, future = inflight.popleft()
+                yield (day, *future.result())
+        while inflight:
+            day, future = inflight.popleft()
+            yield (day, *future.result())
+    finally:
+        for _, future in inflight:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+# --- NORMALIZE ---
+def normalize(chart_data, target_date=None):
+    """
+    Coerce every series to int64 x / float64 y arrays of equal length, drop
+    series without points, and log each chart's cadence.
+    """
+    charts = []
+    for chart_index, chart in enumerate(chart_data):
+        series = []
+        for s in chart.get("series") or []:
+            x, y = s.get("x"), s.get("y")
+            x = np.asarray(x if x is not None else [], dtype=np.int64)
+            # one C-level conversion; JSON nulls (gaps) come out as NaN
+            y = np.asarray(y if y is not None else [], dtype=np.float64)
+            n = min(len(x), len(y))
+            if n:
+                series.append({"name": s["name"], "x": x[:n], "y": y[:n]})
+        if series:
+            deltas = np.diff(series[0]["x"]) / 60_000
+            if len(deltas):
+                print(f"ℹ️ {chart_name(chart_index)} {target_date}: points={len(series[0]['x'])}, "
+                      f"median Δ={int(np.median(deltas))} min")
+        charts.append({"title": chart.get("title"), "series": series})
+    return charts
+
+
+# --- SHEETS SINK ---
+class SheetsSink:
+    """
+    Projects the store onto the Chart_N tabs for the days stored so far,
+    every `sync_every` days and once more on close(). The spreadsheet is
+    only opened the first time there is something to sync.
+    """
+
+    def __init__(self, store, value_input_option="USER_ENTERED", sync_every=SYNC_EVERY_DAYS, partition=None,
+                 journal=None):
+        self.store = store
+        self.value_input_option = value_input_option
+        self.sync_every = sync_every
+        self.partition = partition
+        self.journal = journal
+        self.written = {}
+        self._spreadsheet = None
+        self._index = None
+        self._open_error = None
+        self._window = []
+
+    def epoch_index(self, create=True):
+        """
+        The run's EpochIndex, opening the spreadsheet on first use; with
+        create=False (a dry run) a missing index tab isn't created. If that
+        fails, the same error is raised for the rest of the run rather than
+        retrying the open for every date.
+        """
+        from caiso_quota import schedule
+        from caiso_sheets import EpochIndex, open_spreadsheet
+
+        if self._open_error is not None:
+            raise self._open_error
+        if self._index is None:
+            try:
+                with span("sheets_open"):
+                    # every API call from here on is paced by caiso_quota
+                    spreadsheet = schedule(open_spreadsheet())
+                    self._index = EpochIndex(spreadsheet, create=create)
+                    self._spreadsheet = spreadsheet
+            except Exception as e:
+                self._open_error = e
+                raise
+        return self._index
+
+    def behind(self, day):
+        """
+        Whether a tab is missing some of `day`'s stored rows, or still has
+        revised ones to rewrite, per the epoch index. True when the index
+        can't be read: the sync then decides (and retries) for itself.
+        """
+        from caiso_sheets import partitions
+
+        try:
+            index = self.epoch_index()
+        except Exception as e:
+            print(f"⚠️ Couldn't read the epoch index ({e}); {day} goes to the next sync.")
+            return True
+        start, end = day_bounds_ms(day)
+        for chart in self.store.charts():
+            if len(self.store.revisions(chart, start, end)):
+                return True
+            keys = self.store.keys(chart, start, end)
+            if any(index.missing(tab, keys[a:b]).any() for tab, a, b in partitions(chart, keys, self.partition)):
+                return True
+        return False
+
+    def add(self, day):
+        self._window.append(day)
+        if len(self._window) >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        if not self._window:
+            return
+        from caiso_sheets import sync_from_store
+
+        window, self._window = self._window, []
+        first, last = min(window), max(window)
+        try:
+            self.epoch_index()
+            with span("sheets_sync", start=first, end=last) as s:
+                written = sync_from_store(
+                    self.store, self._spreadsheet, *day_bounds_ms(first, last),
+                    value_input_option=self.value_input_option, epoch_index=self._index,
+                    partition=self.partition,
+                )
+                s["rows"] = sum(written.values())
+        except Exception:
+            # the days are safe in the store; try them again with the next sync
+            self._window = window + self._window
+            raise
+        if self.journal is not None:
+            for day in sorted(set(window)):
+                self.journal.record(day, "synced")
+        for tab, n in written.items():
+            self.written[tab] = self.written.get(tab, 0) + n
+
+    def write_rollups(self):
+        """Mirror the store's daily rollups to the Daily_Rollup tab."""
+        from caiso_sheets import write_rollup_tab
+
+        self.epoch_index()
+        n = write_rollup_tab(self._spreadsheet, self.store, value_input_option=self.value_input_option)
+        print(f"📊 Daily_Rollup now has {n} rows.")
+
+    def close(self):
+        self.sync()
+
+
+# --- RESUME ---
+def _roll_up(store, day, changed):
+    """Recompute a stored day's rollups if it changed or has none yet. Returns rows written."""
+    from caiso_rollup import days_without_rollups, rollup_days
+
+    if not changed and not days_without_rollups(store, [day]):
+        return 0
+    return rollup_days(store, [day])
+
+
+def resume_filter(dates, done, sheets, resync):
+    """
+    Drop the dates a resumed journal already finished (caiso_journal). A
+    date that was stored but not yet synced goes to `resync` instead.
+    """
+    skipped = 0
+    for day in dates:
+        stages = done.get(day, ())
+        if "synced" in stages or "not_found" in stages or "unchanged" in stages or ("stored" in stages and not sheets):
+            skipped += 1
+        elif "stored" in stages:
+            resync.append(day)
+        else:
+            yield day
+    if skipped or resync:
+        print(f"⏩ Resumed: {skipped} dates already done, {len(resync)} stored but not yet synced.")
+
+
+# --- RUN ---
+def run(dates, store, *, mode=None, workers=1, prefetch=None, use_cache=True, refresh=False,
+        pause=0, sheets=True, value_input_option="USER_ENTERED", sync_every=SYNC_EVERY_DAYS,
+        browser_mode=None, gaps_only=False, recheck_days=None, dry_run=False, probe=None,
+        sheets_partition=None, rollups=True, journal=None):
+    """
+    Push `dates` (any iterable, consumed lazily) through every stage.
+    Returns a summary: {"stored": [...], "changed": [...], "not_found": [...], "empty": [...],
+    "failed": {date: exception}, "unchanged": [...], "written": {tab: rows},
+    "plan": [...], "sheets_api": {counter: value}}.
+
+    With gaps_only, the dates are first run through caiso_plan.plan and only
+    the missing or incomplete ones are fetched; days the store has but the
+    tabs don't are only synced. dry_run prints that plan and stops.
+
+    With probe (default: CAISO_PROBE), every date without a fresh payload
+    cache entry is HEAD-requested first, conditional on the ETag /
+    Last-Modified remembered from its last ingest; a 404 or an unchanged
+    report is skipped before any extraction, and an unchanged one is still
+    synced if the tabs lack some of its rows.
+
+    With rollups, the hourly and daily aggregates of each day are recomputed
+    right after it is stored (caiso_rollup), before the journal marks it
+    stored, if it changed or has none yet; days the run skips or only
+    syncs get theirs if they lack them. The Daily_Rollup tab is rewritten
+    at the end.
+
+    With a caiso_journal.Journal, every finished date is checkpointed to it,
+    and dates it already lists as finished (from a resumed journal) are
+    dropped before planning or fetching.
+
+    Sheets calls are paced by caiso_quota's token buckets and retried on
+    429/5xx, so `pause` is only needed to go easy on caiso.com; a sync that
+    still fails leaves its days queued for the next one, and one that fails
+    at the end of the run is reported, not raised: the days are stored.
+    """
+    summary = {"stored": [], "changed": [], "not_found": [], "empty": [], "failed": {}, "unchanged": [],
+               "written": {}, "plan": None}
+    sink = SheetsSink(store, value_input_option, sync_every, sheets_partition, journal) if sheets else None
+    resync, pushed = [], []
+    rolled = 0
+    if journal is not None:
+        dates = resume_filter(dates, journal.completed(), sheets, resync)
+    if gaps_only or dry_run:
+        from caiso_plan import RECHECK_DAYS, plan, print_plan
+
+        dates = list(dates)
+        index = None
+        if sink is not None and dates:
+            try:
+                index = sink.epoch_index(create=not dry_run)
+            except Exception as e:
+                # the store is the system of record: scrape what it lacks, sync another time
+                print(f"⚠️ Couldn't read the epoch index ({e}); planning from the store alone.")
+        with span("plan") as s:
+            work = plan(store, dates, epoch_index=index,
+                        recheck_days=RECHECK_DAYS if recheck_days is None else recheck_days,
+                        partition=sheets_partition)
+            s["rows"] = len(work)
+        print_plan(work)
+        summary["plan"] = work
+        if dry_run:
+            finish()
+            return summary
+        dates = [item["date"] for item in work if item["action"] == "scrape"]
+        if rollups:
+            from caiso_rollup import days_without_rollups, rollup_days
+
+            # stored dates the plan won't scrape may be from a run that died before rolling them up
+            missing = days_without_rollups(store, [item["date"] for item in work if item["action"] != "scrape"])
+            if missing:
+                rolled += rollup_days(store, missing)
+        for item in work:
+            if item["action"] == "sync":
+                try:
+                    sink.add(item["date"])
+                except Exception as e:
+                    print(f"⚠️ Sheets sync failed after {item['date']}, will retry with the next sync: {e}")
+    pool = DriverPool(workers, mode=browser_mode)
+    if (mode or EXTRACT_MODE) == "selenium" and not (gaps_only and not dates):
+        pool.warm()  # Chrome starts while the first dates are being queued
+
+    probe = PROBE if probe is None else probe
+    validators = store.report_validators() if probe else {}
+    cache = default_cache() if probe and use_cache and not refresh else None
+
+    def cached(day):
+        """Whether the payload cache would answer for `day` without asking caiso.com."""
+        meta = cache.meta(day) if cache is not None else None
+        return bool(meta) and cache.is_fresh(meta, day)
+
+    def fetch(day):
+        url, seen, fresh = report_url(day), {}, refresh
+        # a fresh cache entry is used as-is, so probing its date would only cost a request
+        if probe and not cached(day):
+            with span("probe", date=day) as s:
+                state, seen = probe_report(url, *validators.get(url, (None, None)))
+                s["state"] = state
+            if state == "missing":
+                raise ReportNotFound(url)
+            if state == "unchanged":
+                return _UNCHANGED, seen
+            # a report that changed since its last ingest mustn't come from the payload cache
+            fresh = refresh or (state == "changed" and url in validators)
+        with span("fetch", date=day) as s:
+            chart_data = fetch_chart_data(day, mode=mode, pool=pool, use_cache=use_cache, refresh=fresh)
+            s["rows"] = sum(len(series["x"]) for chart in chart_data or [] for series in chart["series"])
+        return chart_data, seen
+
+    try:
+        for day, result, error in fetch_stage(dates, fetch, workers, prefetch):
+            print(f"\n📅 Processing: {day}")
+            if isinstance(error, ReportNotFound):
+                print(f"❌ Report not found for {day} — 404 page.")
+                summary["not_found"].append(day)
+                if journal is not None:
+                    journal.record(day, "not_found")
+                continue
+            chart_data, seen = result or (None, {})
+            if chart_data is _UNCHANGED:
+                summary["unchanged"].append(day)
+                if rollups:
+                    rolled += _roll_up(store, day, changed=False)
+                # the validators are saved at ingest, before the sync: the tabs may still lack the day
+                if sink is not None and sink.behind(day):
+                    print(f"⏭️ Report for {day} unchanged since it was last ingested; syncing what Sheets lacks.")
+                    if journal is not None:
+                        journal.record(day, "stored")
+                    pushed.append(day)
+                    try:
+                        sink.add(day)
+                    except Exception as e:
+                        print(f"⚠️ Sheets sync failed after {day}, will retry with the next sync: {e}")
+                    continue
+                print(f"⏭️ Report for {day} unchanged since it was last ingested.")
+                if journal is not None:
+                    journal.record(day, "unchanged")
+                continue
+            try:
+                if error is not None:
+                    raise error
+                if not chart_data:
+                    print(f"⚠️ No Highcharts data found for {day}.")
+                    summary["empty"].append(day)
+                    continue
+                with span("normalize", date=day):
+                    charts = normalize(chart_data, day)
+                with span("store", date=day) as s:
+                    # series identical to this date's last ingest are skipped by content hash
+                    s["rows"] = changed = sum(store_chart_data(store, charts, day).values())
+                if changed:
+                    summary["changed"].append(day)
+                if rollups:
+                    # before the journal entry: a resumed run skips the date
+                    rolled += _roll_up(store, day, changed)
+                if seen.get("etag") or seen.get("last_modified"):
+                    store.record_report(report_url(day), day, seen.get("etag"), seen.get("last_modified"))
+                if journal is not None:
+                    # the journal must never claim a date the store file doesn't have yet
+                    store.checkpoint()
+                    journal.record(day, "stored", [
+                        (chart_name(i), len(c["series"][0]["x"]) if c["series"] else 0, chart_hash(c))
+                        for i, c in enumerate(charts)
+                    ])
+                summary["stored"].append(day)
+            except Exception as e:
+                print(f"❌ Failed to process {day}: {e}")
+                summary["failed"][day] = e
+                continue
+            # an unchanged payload says nothing about the tabs: an earlier sync may have failed
+            if sink is not None and not changed and not sink.behind(day):
+                print(f"⏭️ {day} is identical to what's stored and already in Sheets.")
+                if journal is not None:
+                    journal.record(day, "synced")
+            elif sink is not None:
+                pushed.append(day)
+                try:
+                    sink.add(day)
+                except Exception as e:
+                    # retries are exhausted (caiso_quota); the date is stored, so it's only deferred
+                    print(f"⚠️ Sheets sync failed after {day}, will retry with the next sync: {e}")
+            if pause:
+                time.sleep(pause)
+        for day in resync:
+            if rollups:
+                rolled += _roll_up(store, day, changed=False)
+            pushed.append(day)
+            try:
+                sink.add(day)
+            except Exception as e:
+                print(f"⚠️ Sheets sync failed after {day}, will retry with the next sync: {e}")
+        if rolled:
+            print(f"📊 Rolled up {rolled} hourly/daily rows.")
+        if sink is not None:
+            from caiso_quota import SCHEDULER
+
+            try:
+                sink.close()
+                # days re-pushed after a failed sync may have missed their Daily_Rollup write too
+                if rollups and pushed:
+                    sink.write_rollups()
+            except Exception as e:
+                # the dates are stored (and journaled as not yet synced); the next run pushes what the tabs lack
+                print(f"⚠️ Sheets sync failed, the store has every date and the next run will retry: {e}")
+            summary["written"] = sink.written
+            summary["sheets_api"] = dict(SCHEDULER.counters)
+            for tab, n in sorted(sink.written.items()):
+                print(f"✅ Wrote {n} rows to {tab}.")
+            print(SCHEDULER.summary())
+    finally:
+        pool.close()
+        # per-stage summary table, Prometheus textfile, --profile dump
+        finish()
+    return summary
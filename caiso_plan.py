@@ -0,0 +1,123 @@
+"""
+Gap-aware backfill planning: work out which report dates actually need a
+scrape instead of walking every date in a range.
+
+For each Pacific report day the store's coverage of every series is
+compared with the number of intervals the day really has at that series'
+cadence: (day length) / (interval), so 288 five-minute intervals normally,
+276 on the spring-forward day and 300 on the fall-back day. A series is only
+expected on a day it appears around: with points within AROUND_DAYS before
+and after it (or before it, at the newest stored day), so a chart or series
+CAISO dropped or introduced doesn't leave every other day incomplete. Each
+day gets one action:
+
+    scrape   the day is missing, or a series expected on it is incomplete
+             (or the day is still inside the --recheck-days revision window)
+    sync     the store is complete but a chart tab (or, partitioned, the
+             tab for that day's period) is missing some of its keys per the
+             _epoch_index tab; only the Sheets sink needs it
+    skip     complete everywhere
+
+    work = plan(store, dates, epoch_index=index)
+    print_plan(work)
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+
+from caiso_store import PACIFIC, day_bounds_ms
+
+DEFAULT_INTERVAL_MS = 5 * 60_000
+DAY_MS = 86_400_000
+AROUND_DAYS = 3
+RECHECK_DAYS = int(os.environ.get("CAISO_RECHECK_DAYS", "0"))
+
+
+def expected_intervals(day, interval_ms=DEFAULT_INTERVAL_MS):
+    """Intervals in a Pacific report day: 288 at 5 min, 276 / 300 on DST days."""
+    start, end = day_bounds_ms(day)
+    return (end - start) // interval_ms
+
+
+def chart_interval_ms(keys):
+    """A chart's cadence: the median step between its stored keys."""
+    if len(keys) < 2:
+        return DEFAULT_INTERVAL_MS
+    step = int(np.median(np.diff(keys)))
+    return step if step > 0 else DEFAULT_INTERVAL_MS
+
+
+def plan(store, dates, epoch_index=None, recheck_days=RECHECK_DAYS, today=None, partition=None):
+    """
+    [{"date", "action", "reason"}] for every date, in date order. Pass the
+    run's EpochIndex (and the sheets partition layout) to also schedule days
+    the tabs are behind on; it is only read.
+    """
+    days = sorted(set(dates))
+    if not days:
+        return []
+    today = today or datetime.now(PACIFIC).date()
+    bounds = [day_bounds_ms(day) for day in days]
+    starts = np.array([b[0] for b in bounds], dtype=np.int64)
+    ends = np.array([b[1] for b in bounds], dtype=np.int64)
+    around = AROUND_DAYS * DAY_MS
+    # the newest stored point: days from there on have no "after" to look at yet
+    newest = max((row[4] for row in store.stats()), default=None)
+    at_front = ends > newest if newest is not None else np.ones(len(days), dtype=bool)
+
+    coverage = {}  # (chart, series) -> (keys, interval, per-day [lo, hi) slices, expected per day)
+    for chart in store.charts():
+        for series, keys in store.series_keys(chart, int(starts[0]) - around, int(ends[-1]) + around).items():
+            lo, hi = np.searchsorted(keys, starts), np.searchsorted(keys, ends)
+            before = hi > np.searchsorted(keys, starts - around)  # a point in [start - around, end)
+            after = np.searchsorted(keys, ends + around) > lo  # a point in [start, end + around)
+            coverage[(chart, series)] = (keys, chart_interval_ms(keys), lo, hi, before & (after | at_front))
+
+    work = []
+    for i, day in enumerate(days):
+        if not coverage:
+            work.append({"date": day, "action": "scrape", "reason": "store is empty"})
+            continue
+        if all(hi[i] == lo[i] for _, _, lo, hi, _ in coverage.values()):
+            work.append({"date": day, "action": "scrape", "reason": "missing"})
+            continue
+        short = []
+        for (chart, series), (keys, interval, lo, hi, expected) in coverage.items():
+            have, want = int(hi[i] - lo[i]), int((ends[i] - starts[i]) // interval)
+            if expected[i] and have < want:
+                short.append(f"{chart}/{series} {have}/{want}")
+        if short:
+            work.append({"date": day, "action": "scrape", "reason": "incomplete: " + ", ".join(short)})
+        elif (today - day).days < recheck_days:
+            work.append({"date": day, "action": "scrape", "reason": f"complete, but within {recheck_days} days"})
+        else:
+            behind = []
+            if epoch_index is not None:
+                from caiso_sheets import partitions
+
+                day_keys = {}
+                for (chart, _), (keys, _, lo, hi, _) in coverage.items():
+                    day_keys.setdefault(chart, []).append(keys[lo[i]:hi[i]])
+                for chart, parts in day_keys.items():
+                    keys = np.unique(np.concatenate(parts))
+                    behind += [tab for tab, a, b in partitions(chart, keys, partition)
+                               if epoch_index.missing(tab, keys[a:b]).any()]
+            if behind:
+                work.append({"date": day, "action": "sync", "reason": "not yet in " + ", ".join(behind)})
+            else:
+                work.append({"date": day, "action": "skip", "reason": "complete"})
+    return work
+
+
+def print_plan(work):
+    """The scrape/sync work list, then one line of totals."""
+    counts = {"scrape": 0, "sync": 0, "skip": 0}
+    for item in work:
+        counts[item["action"]] += 1
+        if item["action"] == "scrape":
+            print(f"🗓️ {item['date']}: scrape — {item['reason']}")
+        elif item["action"] == "sync":
+            print(f"🔁 {item['date']}: sync to Sheets — {item['reason']}")
+    print(f"📋 Plan: {counts['scrape']} to scrape, {counts['sync']} to sync, "
+          f"{counts['skip']} already complete (of {len(work)} dates).")
@@ -0,0 +1,213 @@
+"""
+Quota-aware scheduling of every Google Sheets API call.
+
+The Sheets API allows a fixed number of read and of write requests per
+minute per user (60 each by default). Instead of sleeping a fixed time
+after every date, every call goes through one QuotaScheduler:
+
+- a token bucket per quota (CAISO_SHEETS_READS_PER_MIN,
+  CAISO_SHEETS_WRITES_PER_MIN; 0 = unlimited) refilled continuously, so
+  calls run back to back until the quota is used up and then wait only as
+  long as the next token takes;
+- 429 and 5xx answers (and dropped connections) are retried with
+  exponential backoff and full jitter, honouring Retry-After, up to
+  CAISO_SHEETS_MAX_RETRIES times before the error is raised. Calls that
+  aren't safe to repeat (appends, adding a tab) are retried on 429 only:
+  after a 5xx or a timeout the server may have applied them already;
+- counters for calls, throttled waits, retries and failures.
+
+    spreadsheet = schedule(open_spreadsheet())
+    spreadsheet.worksheet("Chart_1").get_all_values()   # one read token
+    print(SCHEDULER.counters)
+
+Worksheets returned by a scheduled spreadsheet are scheduled as well. Each
+throttle wait and backoff sleep is also a "sheets_throttle" /
+"sheets_backoff" span (caiso_metrics).
+"""
+import os
+import random
+import threading
+import time
+
+from caiso_metrics import span
+
+READS_PER_MIN = int(os.environ.get("CAISO_SHEETS_READS_PER_MIN", "60"))
+WRITES_PER_MIN = int(os.environ.get("CAISO_SHEETS_WRITES_PER_MIN", "60"))
+MAX_RETRIES = int(os.environ.get("CAISO_SHEETS_MAX_RETRIES", "6"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 64.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# gspread methods by the quota they count against; anything else (title,
+# id, row_count, ...) is a local attribute and passes straight through
+SPREADSHEET_READS = {"worksheet", "worksheets", "fetch_sheet_metadata", "values_get", "values_batch_get"}
+SPREADSHEET_WRITES = {"add_worksheet", "del_worksheet", "batch_update", "values_update", "values_batch_update",
+                      "values_append", "values_clear"}
+WORKSHEET_READS = {"get", "get_values", "get_all_values", "get_all_records", "batch_get", "row_values",
+                   "col_values", "acell", "cell"}
+WORKSHEET_WRITES = {"update", "batch_update", "append_row", "append_rows", "insert_rows", "delete_rows",
+                    "resize", "clear", "hide", "show", "update_title", "format"}
+# writes that would be applied twice if repeated after the server already
+# took them; a 429 is a rejection, so those are the only retries they get
+# (spreadsheet batch_update is only ever used to set absolute grid sizes)
+NOT_IDEMPOTENT = {"values_append", "append_row", "append_rows", "insert_rows", "delete_rows",
+                  "add_worksheet", "del_worksheet"}
+
+
+class TokenBucket:
+    """`per_minute` tokens a minute, at most `per_minute` banked. per_minute <= 0 never waits."""
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._clock = clock
+        self._tokens = self.capacity
+        self._stamp = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token; returns the seconds to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1
+            # a negative balance is the queue of callers already waiting
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+def _status(error):
+    """HTTP status of a gspread APIError (or anything carrying a response)."""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryable(error, idempotent=True):
+    if not idempotent:
+        return _status(error) == 429
+    if _status(error) in RETRY_STATUSES:
+        return True
+    # dropped / timed out connections surface as requests' ConnectionError / Timeout
+    return type(error).__name__ in {"ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout"}
+
+
+class QuotaScheduler:
+    """Token buckets for reads and writes plus retry with backoff; see the module docstring."""
+
+    def __init__(self, reads_per_min=READS_PER_MIN, writes_per_min=WRITES_PER_MIN,
+                 max_retries=MAX_RETRIES, sleep=time.sleep):
+        self.buckets = {"read": TokenBucket(reads_per_min), "write": TokenBucket(writes_per_min)}
+        self.max_retries = max_retries
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.counters = {
+            "reads": 0, "writes": 0, "throttled": 0, "throttle_seconds": 0.0,
+            "retries": 0, "rate_limited": 0, "server_errors": 0, "backoff_seconds": 0.0, "failed": 0,
+        }
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self.counters[key] += delta
+
+    def call(self, kind, method, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) as one `kind` ("read" / "write") request;
+        `method`s in NOT_IDEMPOTENT are only retried on 429.
+        """
+        attempt = 0
+        while True:
+            wait = self.buckets[kind].reserve()
+            self._count(**{kind + "s": 1})
+            if wait > 0:
+                self._count(throttled=1, throttle_seconds=wait)
+                with span("sheets_throttle", method=method, kind=kind):
+                    self._sleep(wait)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not _retryable(e, method not in NOT_IDEMPOTENT):
+                    raise
+                if attempt >= self.max_retries:
+                    self._count(failed=1)
+                    raise
+                status = _status(e)
+                delay = _retry_after(e) or random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                self._count(retries=1, backoff_seconds=delay,
+                            rate_limited=int(status == 429), server_errors=int(status is not None and status >= 500))
+                print(f"⏳ Sheets {method} got {status or type(e).__name__}; retrying in {delay:.1f}s "
+                      f"({attempt + 1}/{self.max_retries}).")
+                with span("sheets_backoff", method=method, status=status):
+                    self._sleep(delay)
+                attempt += 1
+
+    def summary(self):
+        c = self.counters
+        return (f"🚦 Sheets API: {c['reads']} reads, {c['writes']} writes, {c['throttled']} throttled "
+                f"({c['throttle_seconds']:.1f}s), {c['retries']} retried ({c['rate_limited']} × 429, "
+                f"{c['server_errors']} × 5xx, {c['backoff_seconds']:.1f}s backoff), {c['failed']} failed.")
+
+
+class _Scheduled:
+    """Forwards attribute access to a gspread object, routing API methods through the scheduler."""
+
+    _reads = frozenset()
+    _writes = frozenset()
+
+    def __init__(self, target, scheduler):
+        self._target = target
+        self._scheduler = scheduler
+
+    def _wrap_result(self, result):
+        return result
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        kind = "read" if name in self._reads else "write" if name in self._writes else None
+        if kind is None or not callable(attr):
+            return attr
+
+        def scheduled(*args, **kwargs):
+            return self._wrap_result(self._scheduler.call(kind, name, attr, *args, **kwargs))
+
+        return scheduled
+
+    def __repr__(self):
+        return f"<scheduled {self._target!r}>"
+
+
+class ScheduledWorksheet(_Scheduled):
+    _reads = frozenset(WORKSHEET_READS)
+    _writes = frozenset(WORKSHEET_WRITES)
+
+
+class ScheduledSpreadsheet(_Scheduled):
+    _reads = frozenset(SPREADSHEET_READS)
+    _writes = frozenset(SPREADSHEET_WRITES)
+
+    def _wrap_result(self, result):
+        if isinstance(result, list):
+            return [self._wrap_result(r) for r in result]
+        if hasattr(result, "get_all_values") and not isinstance(result, _Scheduled):
+            return ScheduledWorksheet(result, self._scheduler)
+        return result
+
+
+SCHEDULER = QuotaScheduler()
+
+
+def schedule(spreadsheet, scheduler=None):
+    """`spreadsheet` with every API call going through `scheduler` (default: the process-wide one)."""
+    if isinstance(spreadsheet, ScheduledSpreadsheet):
+        return spreadsheet
+    return ScheduledSpreadsheet(spreadsheet, scheduler or SCHEDULER)
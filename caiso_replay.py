@@ -0,0 +1,220 @@
+"""
+Offline re-ingest: rebuild the store (and the tabs) from saved payloads
+instead of re-scraping caiso.com, e.g. after the normalization or the
+sheet layout changed.
+
+    python caiso_replay.py saved_reports/ [--start 2023-01-01] [--end 2025-12-31] [--workers 8]
+    python caiso_replay.py .caiso_cache/            # the payload cache works as-is
+
+Inputs, found recursively:
+
+    *.html / *.htm        saved report pages, parsed like the http extract mode
+    *.json                chart_data as caiso_extract.py or the cache write it
+    (either one .gz'd)
+    index/ + objects/     a caiso_cache directory: every index entry's object
+
+The report date comes from the file name (2025-07-01 or the report's own
+jul-01-2025 slug); for the same date twice the newest file wins. Parsing
+and normalizing run on a process pool, at most a few dates ahead of the
+writer, and results come back in date order. Every date goes through the
+same content-hash upsert as a scrape, so replaying unchanged payloads is
+nearly free and changed ones are diffed into revisions. Every replayed
+date goes to the Sheets sync, changed or not, which writes whatever the tabs
+of the current --sheets-partition layout lack (and rewrites revised rows),
+once at the end (or every --sync-every dates).
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from caiso_extract import parse_highcharts_html
+from caiso_metrics import configure as configure_metrics
+from caiso_metrics import finish, span
+from caiso_pipeline import SheetsSink, normalize
+from caiso_sheets import PARTITIONS, SHEETS_EXPORT, SHEETS_PARTITION
+from caiso_store import STORE_PATH, TimeSeriesStore, store_chart_data
+
+SUFFIXES = (".html", ".htm", ".json", ".html.gz", ".htm.gz", ".json.gz")
+
+_ISO_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
+_SLUG_RE = re.compile(r"([a-z]{3}-\d{2}-\d{4})", re.I)
+
+
+def date_from_name(name):
+    """Report date in a file name (2025-07-01 or jul-01-2025), or None."""
+    m = _ISO_RE.search(name)
+    if m:
+        return date.fromisoformat(m.group(1))
+    m = _SLUG_RE.search(name)
+    if m:
+        try:
+            return datetime.strptime(m.group(1).title(), "%b-%d-%Y").date()
+        except ValueError:
+            return None
+    return None
+
+
+def discover(roots, start=None, end=None):
+    """Sorted [(date, path)] of every payload under `roots`, one per date."""
+    found = {}  # date -> (mtime, path)
+    skipped = 0
+    for root in roots:
+        walk = [(os.path.dirname(root), [], [os.path.basename(root)])] if os.path.isfile(root) else os.walk(root)
+        for dirpath, dirnames, filenames in walk:
+            if "index" in dirnames and "objects" in dirnames:
+                dirnames.remove("objects")  # reached through the index entries
+            cache_index = os.path.basename(dirpath) == "index" and os.path.isdir(
+                os.path.join(os.path.dirname(dirpath), "objects"))
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if cache_index and name.endswith(".json"):
+                    try:
+                        with open(path, encoding="utf-8") as f:
+                            meta = json.load(f)
+                        day = date.fromisoformat(meta["date"])
+                        path = os.path.join(os.path.dirname(dirpath), "objects", f"{meta['sha256']}.json.gz")
+                    except (OSError, ValueError, KeyError):
+                        skipped += 1
+                        continue
+                elif name.lower().endswith(SUFFIXES):
+                    day = date_from_name(name)
+                    if day is None:
+                        skipped += 1
+                        continue
+                else:
+                    continue
+                if (start and day < start) or (end and day > end) or not os.path.exists(path):
+                    continue
+                mtime = os.path.getmtime(path)
+                if day not in found or mtime > found[day][0]:
+                    found[day] = (mtime, path)
+    if skipped:
+        print(f"⚠️ Skipped {skipped} files without a report date in their name.")
+    return [(day, path) for day, (_, path) in sorted(found.items())]
+
+
+def load_payload(path):
+    """chart_data from a saved report page or chart_data JSON (optionally gzip'd)."""
+    gz = path.lower().endswith(".gz")
+    with (gzip.open(path, "rt", encoding="utf-8") if gz else open(path, encoding="utf-8")) as f:
+        text = f.read()
+    if (path[:-3] if gz else path).lower().endswith(".json"):
+        return json.loads(text)
+    return parse_highcharts_html(text)
+
+
+def _load(item):
+    """Worker: (date, normalized charts, error)."""
+    day, path = item
+    try:
+        return day, normalize(load_payload(path), day), None
+    except Exception as e:
+        return day, None, f"{type(e).__name__}: {e} ({path})"
+
+
+def load_stage(items, workers=None, prefetch=None):
+    """
+    Yield _load(item) for every item in order, parsed on `workers`
+    processes with at most `prefetch` results outstanding.
+    """
+    workers = workers or os.cpu_count() or 1
+    prefetch = max(prefetch or workers * 4, 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        inflight = deque()
+        for item in items:
+            inflight.append(executor.submit(_load, item))
+            if len(inflight) >= prefetch:
+                yield inflight.popleft().result()
+        while inflight:
+            yield inflight.popleft().result()
+
+
+def replay(items, store, *, workers=None, sheets=True, value_input_option="RAW", sync_every=None,
+           sheets_partition=None, rollups=True):
+    """
+    Store every (date, path) payload in date order, then bring the tabs and
+    rollups up to date. Returns {"stored": [...], "changed": [...],
+    "failed": {date: message}, "written": {tab: rows}}.
+    """
+    summary = {"stored": [], "changed": [], "failed": {}, "written": {}}
+    sink = None
+    if sheets:
+        sink = SheetsSink(store, value_input_option, sync_every or max(len(items), 1), sheets_partition)
+    try:
+        for day, charts, error in load_stage(items, workers):
+            print(f"\n📅 Replaying: {day}")
+            if error is not None:
+                print(f"❌ Failed to load {day}: {error}")
+                summary["failed"][day] = error
+                continue
+            with span("replay", date=day) as s:
+                s["rows"] = sum(len(series["x"]) for chart in charts for series in chart["series"])
+                changed = sum(store_chart_data(store, charts, day).values())
+            summary["stored"].append(day)
+            if changed:
+                summary["changed"].append(day)
+            if sink is not None:
+                # unchanged payloads too: the tabs may be new, e.g. after a partition layout change
+                sink.add(day)
+        rolled = []
+        if rollups:
+            from caiso_rollup import days_without_rollups, rollup_days
+
+            # plus unchanged days that never got theirs, e.g. stored by a run that died
+            rolled = sorted(set(summary["changed"]) | set(days_without_rollups(store, summary["stored"])))
+            if rolled:
+                print(f"📊 Rolled up {rollup_days(store, rolled)} hourly/daily rows.")
+        if sink is not None:
+            sink.close()
+            if rolled:
+                sink.write_rollups()
+            summary["written"] = sink.written
+            for tab, n in sorted(sink.written.items()):
+                print(f"✅ Wrote {n} rows to {tab}.")
+        print(f"🔁 Replayed {len(summary['stored'])} dates ({len(summary['changed'])} changed, "
+              f"{len(summary['failed'])} failed).")
+    finally:
+        finish()
+    return summary
+
+
+def _parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-ingest saved report pages / chart_data JSON without a network")
+    parser.add_argument("roots", nargs="+", metavar="DIR", help="Directories (or files) of saved payloads")
+    parser.add_argument("--start", type=_parse_day, help="First report date to replay (YYYY-MM-DD)")
+    parser.add_argument("--end", type=_parse_day, help="Last report date to replay (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parser processes (default: one per CPU)")
+    parser.add_argument("--store", default=STORE_PATH,
+                        help="SQLite file to replay into (the system of record)")
+    parser.add_argument("--no-sheets", action="store_true", default=not SHEETS_EXPORT,
+                        help="Only rebuild the local store; don't sync the Google Sheet")
+    parser.add_argument("--sheets-partition", choices=PARTITIONS, default=SHEETS_PARTITION,
+                        help="none = one Chart_N tab per chart; month / quarter = Chart_N_2025_07 / Chart_N_2025_Q3 tabs")
+    parser.add_argument("--sync-every", type=int, default=None,
+                        help="Push to Google Sheets every N replayed dates (default: once, at the end)")
+    parser.add_argument("--no-rollups", action="store_true",
+                        help="Don't recompute the hourly/daily rollups for the changed dates")
+    parser.add_argument("--spans", default=None,
+                        help="JSON-lines file for per-stage timing spans (default caiso_spans.jsonl, '' to disable)")
+    args = parser.parse_args()
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    configure_metrics(spans_path=args.spans)
+    items = discover(args.roots, args.start, args.end)
+    if not items:
+        raise SystemExit("📭 No saved payloads found.")
+    print(f"🗂️ {len(items)} dates to replay, {items[0][0]} → {items[-1][0]}.")
+    with TimeSeriesStore(args.store) as store:
+        replay(items, store, workers=args.workers, sheets=not args.no_sheets, sync_every=args.sync_every,
+               sheets_partition=args.sheets_partition, rollups=not args.no_rollups)
@@ -0,0 +1,178 @@
+"""
+Hourly and daily rollups of every stored series, so dashboards can read a
+few hundred summary rows instead of every 5-minute point.
+
+Per (period, chart, series, bucket) the store's `rollups` table keeps
+
+    points       values in the bucket
+    energy_mwh   sum(MW) x interval, for charts whose title is in MW
+                 (state of charge is already MWh, so it gets none)
+    min / max / mean
+    peak_ms      when the max was reached
+
+Buckets are Pacific hours and Pacific report days. A run recomputes each
+day right after storing it (rollup_days), if the day changed or has no
+rollups yet (days_without_rollups, e.g. after a run died in between); the
+daily rows are also mirrored to a compact Daily_Rollup tab
+(caiso_sheets.write_rollup_tab).
+
+    python caiso_rollup.py rebuild [START [END]]
+    python caiso_rollup.py query day|hour [--chart Chart_1] [--start ...] [--end ...] > rollup.csv
+"""
+import argparse
+import re
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from caiso_metrics import span
+from caiso_plan import chart_interval_ms
+from caiso_store import PACIFIC, TimeSeriesStore, day_bounds_ms, local_timestamps
+
+PERIODS = ("hour", "day")
+HOUR_MS = 3_600_000
+COLUMNS = ["chart", "series", "start_ms", "points", "energy_mwh", "min", "max", "mean", "peak_ms"]
+
+_MW_TITLE_RE = re.compile(r"\(MW\)")
+
+
+def is_power_chart(title):
+    """Titles carry their unit: "... (MW)" is power, "... (MWh)" is energy."""
+    return title is None or bool(_MW_TITLE_RE.search(title))
+
+
+def bucket_starts(keys, period):
+    """Start (epoch ms) of the Pacific hour or day each key falls in."""
+    keys = np.asarray(keys, dtype=np.int64)
+    if period == "hour":
+        # US/Pacific offsets are whole hours, so local hours are UTC hours
+        return keys - keys % HOUR_MS
+    if not len(keys):
+        return keys
+    first = datetime.fromtimestamp(int(keys.min()) / 1000, PACIFIC).date()
+    last = datetime.fromtimestamp(int(keys.max()) / 1000, PACIFIC).date()
+    midnights = np.array([day_bounds_ms(first + timedelta(days=i))[0] for i in range((last - first).days + 1)],
+                         dtype=np.int64)
+    return midnights[np.searchsorted(midnights, keys, side="right") - 1]
+
+
+def compute_rollups(frame, period, interval_ms, energy=True):
+    """
+    Aggregate a wide store frame (epoch-ms index, one column per series) into
+    [(series, start_ms, points, energy_mwh, min, max, mean, peak_ms)].
+
+    Keys are sorted, so each bucket is a contiguous slice and every statistic
+    is one np.*.reduceat over the column; NaNs (gaps) are left out.
+    """
+    if frame.empty:
+        return []
+    keys = frame.index.to_numpy(dtype=np.int64)
+    buckets = bucket_starts(keys, period)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+    rows = []
+    for series in frame.columns:
+        values = frame[series].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        counts = np.add.reduceat(valid, starts)
+        sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+        lows = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+        highs = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+        # first point of each bucket that reaches the bucket's max
+        at_max = np.flatnonzero(valid & (values == np.repeat(highs, ends - starts)))
+        first = np.unique(np.searchsorted(starts, at_max, side="right") - 1, return_index=True)
+        peaks = np.zeros(len(starts), dtype=np.int64)
+        peaks[first[0]] = keys[at_max[first[1]]]
+        energies = sums * (interval_ms / HOUR_MS)
+        for i in np.flatnonzero(counts):
+            rows.append((
+                series, int(buckets[starts[i]]), int(counts[i]),
+                float(energies[i]) if energy else None,
+                float(lows[i]), float(highs[i]), float(sums[i] / counts[i]), int(peaks[i]),
+            ))
+    return rows
+
+
+def _day_runs(days):
+    """Consecutive runs of days as (first, last) pairs."""
+    runs = []
+    for day in sorted(set(days)):
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(r) for r in runs]
+
+
+def rollup_days(store, days, charts=None):
+    """Recompute every period's rollups for the Pacific days given. Returns rows written."""
+    written = 0
+    for first, last in _day_runs(days):
+        start_ms, end_ms = day_bounds_ms(first, last)
+        for chart in charts or store.charts():
+            with span("rollup", chart=chart, start=first, end=last) as s:
+                frame = store.frame(chart, start_ms, end_ms)
+                interval = chart_interval_ms(frame.index.to_numpy(dtype=np.int64))
+                energy = is_power_chart(store.chart_title(chart))
+                for period in PERIODS:
+                    rows = compute_rollups(frame, period, interval, energy)
+                    store.replace_rollups(period, chart, start_ms, end_ms, rows)
+                    written += len(rows)
+                s["rows"] = len(frame)
+    return written
+
+
+def days_without_rollups(store, days):
+    """The days among `days` with no daily rollup rows, in order."""
+    days = sorted(set(days))
+    if not days:
+        return []
+    start_ms, end_ms = day_bounds_ms(days[0], days[-1])
+    have = {row[2] for row in store.rollups("day", None, start_ms, end_ms)}
+    return [day for day in days if day_bounds_ms(day)[0] not in have]
+
+
+def rollup_frame(store, period, chart=None, start_ms=None, end_ms=None):
+    """Rollups as a DataFrame with a local-time "start" column first."""
+    import pandas as pd
+
+    frame = pd.DataFrame(store.rollups(period, chart, start_ms, end_ms), columns=COLUMNS)
+    frame.insert(0, "start", local_timestamps(frame["start_ms"]) if len(frame) else [])
+    frame.insert(len(frame.columns), "peak_time", local_timestamps(frame["peak_ms"]) if len(frame) else [])
+    return frame
+
+
+def _parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hourly / daily rollups of the local CAISO store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="Recompute rollups for a day range (default: everything stored)")
+    rebuild.add_argument("start", nargs="?", type=_parse_day)
+    rebuild.add_argument("end", nargs="?", type=_parse_day)
+    query = sub.add_parser("query", help="Write rollups as CSV to stdout")
+    query.add_argument("period", choices=PERIODS)
+    query.add_argument("--chart", help="e.g. Chart_1")
+    query.add_argument("--start", type=_parse_day, help="First Pacific day (YYYY-MM-DD)")
+    query.add_argument("--end", type=_parse_day, help="Day after the last one (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    with TimeSeriesStore() as store:
+        if args.command == "rebuild":
+            if args.start:
+                first, last = args.start, args.end or args.start
+            else:
+                spans = [(lo, hi) for _, _, _, lo, hi in store.stats()]
+                if not spans:
+                    sys.exit("📭 The store is empty.")
+                first = datetime.fromtimestamp(min(lo for lo, _ in spans) / 1000, PACIFIC).date()
+                last = datetime.fromtimestamp(max(hi for _, hi in spans) / 1000, PACIFIC).date()
+            days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+            print(f"✅ Wrote {rollup_days(store, days)} rollup rows for {first} → {last}.")
+        else:
+            start_ms = day_bounds_ms(args.start)[0] if args.start else None
+            end_ms = day_bounds_ms(args.end)[0] if args.end else None
+            rollup_frame(store, args.period, args.chart, start_ms, end_ms).to_csv(sys.stdout, index=False)
@@ -0,0 +1,949 @@
+"""
+Google Sheets helpers shared by the scrapers.
+
+EpochIndex keeps the set of epoch-ms keys already written to each Chart_N tab
+in a hidden metadata tab (INDEX_TAB), stored as runs of evenly spaced keys so
+a year of 5-minute data is a handful of [start, step, count] triples. Dedupe
+then reads that one small tab per run instead of get_all_values() on every
+chart tab for every date.
+
+If the index and a sheet ever disagree (someone edited a tab by hand, a run
+died between the append and the index save), rebuild it from the sheet:
+
+    python caiso_sheets.py rebuild-index            # every Chart_N tab
+    python caiso_sheets.py rebuild-index Chart_2    # just one
+
+The tabs are a projection of the local store (caiso_store.py). `sync`
+pushes whatever the store has that a tab doesn't; `import-tabs` seeds an
+empty store from the sheet once:
+
+    python caiso_sheets.py sync [2025-07-01 [2025-07-31]]
+    python caiso_sheets.py import-tabs
+
+With CAISO_SHEETS_PARTITION=month (or quarter) each chart is split over one
+tab per Pacific month (Chart_1_2025_07) or quarter (Chart_1_2025_Q3).
+Rows are routed to their partition, new partitions are created as the
+dates roll over, and a sync only reads and dedupes against the partitions
+its dates fall in, so per-run cost stays flat as history grows.
+"""
+import base64
+import json
+import math
+import os
+import re
+import sys
+from datetime import date, datetime, timezone
+from itertools import compress
+
+import numpy as np
+
+from caiso_metrics import span
+from caiso_store import PACIFIC, TimeSeriesStore, day_bounds_ms, local_timestamps
+
+SPREADSHEET_NAME = "CAISO Storage Chart Data"
+INDEX_TAB = "_epoch_index"
+INDEX_HEADER = ["Tab", "Rows", "Keys", "UpdatedAt", "Runs"]
+ROLLUP_TAB = "Daily_Rollup"
+ROLLUP_HEADER = ["Date", "Chart", "Series", "Energy (MWh)", "Min", "Max", "Mean", "Peak time", "Points"]
+CELL_CHARS = 45000  # Sheets caps a cell at 50k characters
+NO_KEY = np.iinfo(np.int64).min
+MAX_PAYLOAD_BYTES = 2_000_000  # Google's recommended ceiling per request
+MAX_PENDING_ROWS = 50_000
+# The local store is the system of record; CAISO_SHEETS_EXPORT=0 skips Sheets entirely
+SHEETS_EXPORT = os.environ.get("CAISO_SHEETS_EXPORT", "1") != "0"
+# "none" = one Chart_N tab per chart, "month" / "quarter" = one tab per period
+PARTITIONS = ("none", "month", "quarter")
+SHEETS_PARTITION = os.environ.get("CAISO_SHEETS_PARTITION", "none")
+
+# Timestamp layouts seen in the Chart_N tabs: what we write (2025-08-07 09:05:00)
+# and what Sheets shows once USER_ENTERED values became dates (8/7/2025 9:05:00).
+# Seconds and the whole time part are optional; anything else falls back to pandas.
+_TS_WIDTH = len("12/31/2025 23:59:59")
+_PARSE_CHUNK = 1 << 16
+
+
+def open_spreadsheet():
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    creds_json = base64.b64decode(os.environ["GOOGLE_SHEETS_KEY_BASE64"]).decode("utf-8")
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(creds_json), scope)
+    return gspread.authorize(creds).open(SPREADSHEET_NAME)
+
+
+# --- TIMESTAMPS ---
+def _localize_pacific(s):
+    try:
+        try:
+            return s.dt.tz_localize("US/Pacific", ambiguous="infer", nonexistent="NaT")
+        except TypeError:
+            # Older pandas without 'nonexistent' kw
+            return s.dt.tz_localize("US/Pacific", ambiguous="infer")
+    except Exception:
+        # The fall-back hour can't be inferred unless both copies are present
+        return s.dt.tz_localize("US/Pacific", ambiguous="NaT", nonexistent="NaT")
+
+
+def _to_epoch_ms(naive):
+    """Naive US/Pacific datetimes -> int64 epoch ms (NO_KEY where it doesn't exist)."""
+    import pandas as pd
+
+    local = _localize_pacific(pd.Series(naive))
+    ns = local.dt.tz_convert("UTC").array.asi8 if len(local) else np.empty(0, dtype=np.int64)
+    out = ns // 1_000_000
+    out[local.isna().to_numpy()] = NO_KEY
+    return out
+
+
+def _digits(chars, start, end, width):
+    """Integer value of chars[i, start[i]:end[i]] for each row (at most `width` digits)."""
+    rows = np.arange(len(chars))
+    value = np.zeros(len(chars), dtype=np.int64)
+    ok = (end > start) & (end - start <= width)
+    for k in range(width):
+        idx = start + k
+        inside = idx < end
+        digit = chars[rows, np.minimum(idx, chars.shape[1] - 1)].astype(np.int64) - ord("0")
+        ok &= ~inside | ((digit >= 0) & (digit <= 9))
+        value = np.where(inside, value * 10 + digit, value)
+    return value, ok
+
+
+def _parse_known_layouts(strings):
+    """
+    Vectorized parse of 'YYYY-MM-DD[ HH:MM[:SS]]' and 'M/D/YYYY[ H:MM[:SS]]'.
+    Returns (datetime64[ns] array, mask of rows that matched a known layout).
+    """
+    n = len(strings)
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=n)
+    fits = lengths <= _TS_WIDTH
+    if not fits.all():
+        strings = [v if ok else "" for v, ok in zip(strings, fits)]
+    wide = np.array(strings, dtype=f"U{_TS_WIDTH}").view(np.uint32).reshape(n, _TS_WIDTH)
+    fits &= ~(wide > 127).any(axis=1)
+    chars = wide.astype(np.uint8)
+    del wide
+
+    def positions(ch):
+        hit = chars == ord(ch)
+        count = hit.sum(axis=1)
+        first = np.where(count > 0, hit.argmax(axis=1), lengths)
+        last = np.where(count > 0, _TS_WIDTH - 1 - hit[:, ::-1].argmax(axis=1), lengths)
+        return count, first, last
+
+    n_dash, dash1, dash2 = positions("-")
+    n_slash, slash1, slash2 = positions("/")
+    n_space, space, _ = positions(" ")
+    n_colon, colon1, colon2 = positions(":")
+    iso = (n_dash == 2) & (n_slash == 0)
+    us = (n_slash == 2) & (n_dash == 0)
+    sep1 = np.where(iso, dash1, slash1)
+    sep2 = np.where(iso, dash2, slash2)
+    date_end = np.where(n_space == 1, space, lengths)
+
+    a, ok_a = _digits(chars, np.zeros(n, dtype=np.int64), sep1, 4)
+    b, ok_b = _digits(chars, sep1 + 1, sep2, 2)
+    c, ok_c = _digits(chars, sep2 + 1, date_end, 4)
+    year = np.where(iso, a, c)
+    month = np.where(iso, b, a)
+    day = np.where(iso, c, b)
+    ok = fits & (iso | us) & ok_a & ok_b & ok_c & (n_space <= 1)
+    ok &= np.where(iso, (sep1 == 4) & (date_end - sep2 - 1 == 2), date_end - sep2 - 1 == 4)
+
+    has_time = n_space == 1
+    hour_end = np.where(n_colon > 0, colon1, lengths)
+    minute_end = np.where(n_colon == 2, colon2, lengths)
+    hour, ok_h = _digits(chars, space + 1, hour_end, 2)
+    minute, ok_m = _digits(chars, colon1 + 1, minute_end, 2)
+    second, ok_s = _digits(chars, colon2 + 1, lengths, 2)
+    second = np.where(n_colon == 2, second, 0)
+    ok &= ~has_time | ((n_colon >= 1) & (n_colon <= 2) & ok_h & ok_m & (minute_end - colon1 - 1 == 2))
+    ok &= (n_colon != 2) | (ok_s & (lengths - colon2 - 1 == 2))
+    ok &= has_time | (n_colon == 0)
+    hour, minute = np.where(has_time, hour, 0), np.where(has_time, minute, 0)
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+
+    months = np.where(ok, (year - 1970) * 12 + month - 1, 0).astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + np.where(ok, day - 1, 0)
+    ok &= days.astype("datetime64[M]") == months  # rejects Feb 30 and friends
+    seconds = hour * 3600 + minute * 60 + second
+    parsed = days.astype("datetime64[ns]") + seconds.astype("timedelta64[s]")
+    parsed[~ok] = np.datetime64("NaT")
+    return parsed, ok
+
+
+def sheet_row_keys(existing_rows):
+    """
+    Epoch-ms key of every row from the sheet's first column (Timestamp), in
+    sheet order, NO_KEY for blank or unparseable cells. Tolerates mixed
+    display formats like '8/7/2025 9:05:00' and '2025-08-07 09:05:00'. The
+    known layouts are parsed in one vectorized pass; only leftovers go
+    through pandas' per-element format inference.
+    """
+    filled = np.fromiter((bool(r and r[0]) for r in existing_rows), dtype=bool, count=len(existing_rows))
+    out = np.full(len(existing_rows), NO_KEY, dtype=np.int64)
+    strings = [r[0] for r, f in zip(existing_rows, filled) if f]
+    if not strings:
+        return out
+    parsed = np.empty(len(strings), dtype="datetime64[ns]")
+    known = np.empty(len(strings), dtype=bool)
+    for i in range(0, len(strings), _PARSE_CHUNK):  # bounds the scratch matrices
+        parsed[i:i + _PARSE_CHUNK], known[i:i + _PARSE_CHUNK] = _parse_known_layouts(strings[i:i + _PARSE_CHUNK])
+    if not known.all():
+        import pandas as pd
+
+        rest = pd.Series([v for v, k in zip(strings, known) if not k], dtype=object)
+        parsed[~known] = pd.to_datetime(rest, format="mixed", errors="coerce").to_numpy()
+    # Treat timestamps as US/Pacific local, then convert to UTC to match Highcharts epochs
+    out[filled] = _to_epoch_ms(parsed)
+    return out
+
+
+def parse_sheet_timestamps_to_epoch_ms(existing_rows):
+    """Sorted, unique int64 array of the epoch-ms keys in a sheet's Timestamp column."""
+    keys = np.sort(sheet_row_keys(existing_rows))
+    keys = keys[keys != NO_KEY]
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+
+
+# --- EPOCH INDEX ---
+def _to_runs(keys):
+    """Sorted unique keys -> [[start, step, count], ...]"""
+    keys = np.asarray(keys, dtype=np.int64)
+    n = len(keys)
+    d = np.diff(keys)
+    # diff positions where the spacing changes; each run ends at the next one
+    breaks = np.flatnonzero(d[1:] != d[:-1]) + 1
+    runs = []
+    i = 0
+    while i < n:
+        if i == n - 1:
+            runs.append([int(keys[i]), 0, 1])
+            break
+        j = np.searchsorted(breaks, i, side="right")
+        end = int(breaks[j]) if j < len(breaks) else n - 1
+        runs.append([int(keys[i]), int(d[i]), end - i + 1])
+        i = end + 1
+    return runs
+
+
+def _from_runs(runs):
+    if not runs:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([start + step * np.arange(count, dtype=np.int64) for start, step, count in runs])
+
+
+def _merge_placements(placed):
+    """Placements in row order, with runs on adjacent rows that continue each other's spacing joined."""
+    out = []
+    for row, start, step, count in sorted(placed):
+        if out:
+            r, s, st, c = out[-1]
+            joined = st if c > 1 else start - s  # spacing of the run they'd make together
+            if (r + c == row and joined > 0 and start == s + joined * c
+                    and (count == 1 or step == joined)):
+                out[-1] = [r, s, joined, c + count]
+                continue
+        out.append([row, start, step, count])
+    return out
+
+
+def _placements(keys, first_row):
+    """
+    Keys in sheet order (row `first_row` onwards) -> [[row, start, step, count], ...]:
+    runs of evenly spaced keys on consecutive rows. NO_KEY rows are left out.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    valid = keys != NO_KEY
+    # maximal blocks of consecutive rows that all have a key
+    edges = np.flatnonzero(np.diff(np.r_[0, valid.astype(np.int8), 0]))
+    placed = []
+    for lo, hi in zip(edges[::2], edges[1::2]):
+        row = first_row + int(lo)
+        for start, step, count in _to_runs(keys[lo:hi]):
+            placed.append([row, start, step, count])
+            row += count
+    return placed
+
+
+class _TabIndex:
+    def __init__(self, runs=None, rows=0, placed=()):
+        self.rows = rows
+        # None when the rows the keys sit on aren't known (see rows_of)
+        self.placed = None if placed is None else list(placed)
+        self._set_runs(runs or [])
+
+    def _set_runs(self, runs):
+        self.runs = runs
+        arr = np.array(runs, dtype=np.int64).reshape(-1, 3)
+        self._starts, self._steps, self._counts = arr[:, 0], arr[:, 1], arr[:, 2]
+
+    @property
+    def key_count(self):
+        return int(self._counts.sum())
+
+    def contains_mask(self, keys):
+        """Vectorized membership test for an int64 array of keys."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if not self.runs:
+            return np.zeros(len(keys), dtype=bool)
+        i = np.searchsorted(self._starts, keys, side="right") - 1
+        found = i >= 0
+        i = np.maximum(i, 0)
+        offset = keys - self._starts[i]
+        step = self._steps[i]
+        safe_step = np.where(step > 0, step, 1)
+        on_grid = (step > 0) & (offset % safe_step == 0) & (offset // safe_step < self._counts[i])
+        return found & ((offset == 0) | on_grid)
+
+    def add(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        self._set_runs(_to_runs(np.union1d(_from_runs(self.runs), keys[keys != NO_KEY])))
+
+    def place(self, keys, first_row):
+        if self.placed is not None:
+            # a daily sync continues the previous block: keep the entry from growing per write
+            self.placed = _merge_placements(self.placed + _placements(keys, first_row))
+
+    def rows_of(self, keys):
+        """1-based sheet row of each key; 0 where it isn't placed."""
+        keys = np.asarray(keys, dtype=np.int64)
+        rows = np.zeros(len(keys), dtype=np.int64)
+        for row, start, step, count in self.placed or []:
+            offset = keys - start
+            if step:
+                hit = (offset % step == 0) & (offset // step >= 0) & (offset // step < count)
+                rows[hit] = row + offset[hit] // step
+            else:
+                rows[offset == 0] = row
+        return rows
+
+
+class EpochIndex:
+    def __init__(self, spreadsheet, create=True):
+        """
+        Load the index tab. With create=False (a dry run) a missing tab
+        reads as an empty index and nothing is ever written.
+        """
+        import gspread
+
+        self.spreadsheet = spreadsheet
+        self.read_only = not create
+        self._tabs = {}
+        self._dirty = set()
+        self._sheets = {}  # tab -> worksheet handle, for the life of the run
+        self._stale = set()  # tabs a failed write may have left out of step with their entry
+        self._saved_rows = 1  # rows the index tab holds, so save() can blank any it no longer needs
+        try:
+            self._sheet = spreadsheet.worksheet(INDEX_TAB)
+        except gspread.exceptions.WorksheetNotFound:
+            if not create:
+                self._sheet = None
+                return
+            self._sheet = spreadsheet.add_worksheet(title=INDEX_TAB, rows="20", cols=str(len(INDEX_HEADER)))
+            self._sheet.hide()
+            self._sheet.update("A1", [INDEX_HEADER])
+            return
+        with span("get_all_values", tab=INDEX_TAB) as s:
+            values = self._sheet.get_all_values()
+            s["rows"] = len(values)
+        self._saved_rows = max(len(values), 1)
+        for row in values[1:]:
+            if not row or not row[0]:
+                continue
+            entry = json.loads("".join(row[4:]) or "[]")
+            if isinstance(entry, list):  # written before rows were placed
+                self._tabs[row[0]] = _TabIndex(entry, int(row[1] or 0), placed=None)
+            else:
+                self._tabs[row[0]] = _TabIndex(entry["runs"], int(row[1] or 0), entry["placed"])
+
+    def has(self, tab):
+        return tab in self._tabs
+
+    def rows(self, tab):
+        return self._tabs[tab].rows if tab in self._tabs else 0
+
+    def missing(self, tab, keys):
+        """Boolean mask of the keys not yet written to `tab`."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if tab not in self._tabs:
+            return np.ones(len(keys), dtype=bool)
+        return ~self._tabs[tab].contains_mask(keys)
+
+    def reset(self, tab):
+        """Forget a tab, e.g. after it was (re)created empty."""
+        self._tabs[tab] = _TabIndex()
+        self._stale.discard(tab)
+        self._dirty.add(tab)
+
+    def add(self, tab, keys, rows, first_row=None):
+        """
+        Record `rows` appended rows whose epoch-ms keys are `keys`, written
+        from sheet row `first_row` on (None: somewhere unknown, e.g. appended).
+        """
+        entry = self._tabs.setdefault(tab, _TabIndex())
+        entry.add(keys)
+        if first_row is None:
+            entry.placed = None
+        else:
+            entry.place(keys, first_row)
+        entry.rows += rows
+        self._dirty.add(tab)
+
+    def rows_of(self, tab, keys):
+        """
+        Sheet row of each key in `tab` (0 where unknown), or None if the tab's
+        rows were never placed and it needs a rebuild() first.
+        """
+        entry = self._tabs.get(tab)
+        if entry is None or entry.placed is None:
+            return None
+        return entry.rows_of(keys)
+
+    def rebuild(self, sheet):
+        """Re-read a chart tab in full and replace its index entry."""
+        with span("get_all_values", tab=sheet.title) as s:
+            existing = sheet.get_all_values()
+            s["rows"] = len(existing)
+        keys = sheet_row_keys(existing[1:])
+        self._tabs[sheet.title] = _TabIndex(_to_runs(np.unique(keys[keys != NO_KEY])), len(existing),
+                                            _placements(keys, 2))
+        self._dirty.add(sheet.title)
+        return self._tabs[sheet.title]
+
+    def ensure(self, sheet):
+        """Load a tab's index entry, rebuilding it from the sheet the first time (or after invalidate)."""
+        if sheet.title not in self._tabs or sheet.title in self._stale:
+            self._stale.discard(sheet.title)
+            self.rebuild(sheet)
+
+    def sheet(self, tab):
+        """The worksheet handle opened for `tab` earlier in the run, or None."""
+        return self._sheets.get(tab)
+
+    def remember(self, tab, sheet):
+        self._sheets[tab] = sheet
+
+    def invalidate(self, tab):
+        """
+        Forget a tab's handle and trust its entry no longer: after a failed
+        write the tab is re-opened and re-read the next time it's used.
+        """
+        self._sheets.pop(tab, None)
+        self._stale.add(tab)
+
+    def save(self):
+        if not self._dirty or self.read_only:
+            return
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        values = [INDEX_HEADER]
+        for tab in sorted(self._tabs):
+            entry = self._tabs[tab]
+            runs = json.dumps({"runs": entry.runs, "placed": entry.placed}, separators=(",", ":"))
+            chunks = [runs[i:i + CELL_CHARS] for i in range(0, len(runs), CELL_CHARS)] or [""]
+            values.append([tab, entry.rows, entry.key_count, now] + chunks)
+        width = max(len(r) for r in values)
+        if self._sheet.col_count < width or self._sheet.row_count < len(values):
+            self._sheet.resize(rows=max(self._sheet.row_count, len(values)), cols=max(self._sheet.col_count, width))
+        # blank the whole old extent: an entry that shrank (after a rebuild) must
+        # not leave chunks of its longer self behind in the columns after it
+        width = max(width, self._sheet.col_count)
+        values += [[]] * (self._saved_rows - len(values))
+        with span("index_save", rows=len(values)):
+            self._sheet.update("A1", [r + [""] * (width - len(r)) for r in values], value_input_option="RAW")
+        self._saved_rows = len(values)
+        self._dirty.clear()
+
+
+# --- WRITE BUFFER ---
+def block_rows(keys, values):
+    """
+    Sheet rows for an aligned block (caiso_store.align_series): the local
+    timestamp, then every value with NaN as "". Masked in bulk; the only
+    per-row work is the final tolist().
+    """
+    cells = np.empty((len(keys), values.shape[1] + 1), dtype=object)
+    cells[:, 0] = np.asarray(local_timestamps(keys), dtype=object)
+    cells[:, 1:] = values
+    cells[:, 1:][np.isnan(values)] = ""
+    return cells.tolist()
+
+
+def sanitize_row(row):
+    return [
+        "" if isinstance(v, float) and (math.isnan(v) or math.isinf(v)) else v
+        for v in row
+    ]
+
+
+def _a1(tab, row, col=1):
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return "'{}'!{}{}".format(tab.replace("'", "''"), letters, row)
+
+
+class SheetWriteBuffer:
+    """
+    Collects new rows per Chart_N tab across dates and writes them all at the
+    end of the run (or once MAX_PENDING_ROWS pile up) with a handful of calls:
+
+    - one batchGet to confirm each tab ends where the epoch index says it does
+    - at most one batchUpdate to grow the grids that are too small
+    - values.batchUpdate requests chunked to stay under MAX_PAYLOAD_BYTES
+
+    Rows are deduped against the index *and* everything already queued, so
+    overlapping dates in one run don't double-write. A tab whose end doesn't
+    match the index falls back to values.append, which can't overwrite data.
+
+    Rows queued with rewrite() replace the value cells of rows a tab already
+    has, in place, as ranges in the same values.batchUpdate calls; only
+    tabs whose end matches the index are rewritten.
+    """
+
+    def __init__(self, spreadsheet, epoch_index, value_input_option="USER_ENTERED",
+                 max_payload_bytes=MAX_PAYLOAD_BYTES, max_pending_rows=MAX_PENDING_ROWS):
+        self.spreadsheet = spreadsheet
+        self.index = epoch_index
+        self.value_input_option = value_input_option
+        self.max_payload_bytes = max_payload_bytes
+        self.max_pending_rows = max_pending_rows
+        self._pending = {}  # tab -> {"rows": [...], "keys": [arrays], "header": bool}
+        self._rewrites = {}  # tab -> {sheet row: (key, values)}
+        self.written = {}
+        self.rewritten = {}  # tab -> int64 keys rewritten in place
+
+    def _queued_keys(self, tab):
+        entry = self._pending.get(tab)
+        if not entry or not entry["keys"]:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(entry["keys"])
+
+    def pending_rows(self):
+        return sum(len(e["rows"]) for e in self._pending.values()) + sum(map(len, self._rewrites.values()))
+
+    def rewrite(self, tab, rows, keys, values):
+        """
+        Queue new `values` (cells after the timestamp) for existing sheet
+        `rows` of `tab`. A row queued again replaces its earlier values, so
+        the latest revision is the one written.
+        """
+        self._rewrites.setdefault(tab, {}).update(zip(np.asarray(rows).tolist(), zip(np.asarray(keys).tolist(), values)))
+        if self.pending_rows() >= self.max_pending_rows:
+            self.flush()
+        return len(keys)
+
+    def add(self, tab, rows, keys, header=None, clean=False):
+        """
+        Queue `rows` (aligned with int64 epoch-ms `keys`) for `tab`, skipping
+        keys already written or queued. `header` is written first if the tab
+        is still empty. `clean` rows (e.g. from block_rows) skip the per-cell
+        sanitize_row pass. Returns how many data rows were queued.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        mask = self.index.missing(tab, keys)
+        queued = self._queued_keys(tab)
+        if len(queued):
+            mask &= ~np.isin(keys, queued)
+        mask |= keys == NO_KEY
+        if clean:
+            new_rows = list(compress(rows, mask))
+        else:
+            new_rows = [sanitize_row(r) for r, keep in zip(rows, mask) if keep]
+        if not new_rows:
+            return 0
+        entry = self._pending.setdefault(tab, {"rows": [], "keys": [], "header": False})
+        if header is not None and self.index.rows(tab) == 0 and not entry["rows"]:
+            entry["rows"].append(list(header))
+            entry["header"] = True
+        entry["rows"].extend(new_rows)
+        entry["keys"].append(keys[mask])
+        if self.pending_rows() >= self.max_pending_rows:
+            self.flush()
+        return len(new_rows)
+
+    def _check_ends(self, tabs):
+        """Tabs whose last row really is where the epoch index says."""
+        ranges = []
+        for tab in tabs:
+            rows = self.index.rows(tab)
+            ranges.append(f"{_a1(tab, max(rows, 1))}:A{rows + 1}")
+        with span("values_batch_get", tabs=len(tabs)):
+            resp = self.spreadsheet.values_batch_get(ranges, params={"majorDimension": "ROWS"})
+        ok = set()
+        for tab, vr in zip(tabs, resp.get("valueRanges", [])):
+            values = vr.get("values", [])
+            rows = self.index.rows(tab)
+            expected = 1 if rows > 0 else 0
+            if len(values) == expected and all(v and v[0] != "" for v in values):
+                ok.add(tab)
+        return ok
+
+    def _grow_grids(self, needs):
+        """needs: tab -> (rows, cols) the grid must have."""
+        with span("fetch_sheet_metadata"):
+            meta = self.spreadsheet.fetch_sheet_metadata()
+        requests = []
+        for sheet in meta.get("sheets", []):
+            props = sheet["properties"]
+            if props["title"] not in needs:
+                continue
+            grid = props.get("gridProperties", {})
+            want_rows, want_cols = needs[props["title"]]
+            rows, cols = grid.get("rowCount", 0), grid.get("columnCount", 0)
+            if want_rows > rows or want_cols > cols:
+                requests.append({"updateSheetProperties": {
+                    "properties": {"sheetId": props["sheetId"], "gridProperties": {
+                        "rowCount": max(rows, want_rows), "columnCount": max(cols, want_cols)}},
+                    "fields": "gridProperties(rowCount,columnCount)",
+                }})
+        if requests:
+            with span("grow_grids", tabs=len(requests)):
+                self.spreadsheet.batch_update({"requests": requests})
+
+    def _chunks(self, blocks):
+        """Split (tab, start_row, col, rows) blocks into (block, lo, hi) requests under the payload cap."""
+        chunk, size = [], 0
+        for block in blocks:
+            rows, lo = block[3], 0
+            for hi, row in enumerate(rows):
+                row_bytes = len(str(row)) + 1  # within a few bytes of its JSON, far cheaper
+                if size + row_bytes > self.max_payload_bytes and (chunk or hi > lo):
+                    if hi > lo:
+                        chunk.append((block, lo, hi))
+                    yield chunk
+                    chunk, size, lo = [], 0, hi
+                size += row_bytes
+            if len(rows) > lo:
+                chunk.append((block, lo, len(rows)))
+        if chunk:
+            yield chunk
+
+    def flush(self):
+        """Write everything queued. Returns {tab: rows written} for this flush."""
+        if not self._pending and not self._rewrites:
+            return {}
+        with span("sheets_flush", tabs=len(self._pending.keys() | self._rewrites.keys())) as s:
+            flushed = self._flush()
+            s["rows"] = sum(flushed.values())
+        return flushed
+
+    @staticmethod
+    def _rewrite_runs(updates):
+        """{sheet row: (key, values)} -> [(first row, keys, rows)] over consecutive rows."""
+        runs = []
+        for row in sorted(updates):
+            key, values = updates[row]
+            if runs and row == runs[-1][0] + len(runs[-1][2]):
+                runs[-1][1].append(key)
+                runs[-1][2].append(values)
+            else:
+                runs.append((row, [key], [values]))
+        return runs
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        rewrites, self._rewrites = self._rewrites, {}
+        tabs = sorted(pending.keys() | rewrites.keys())
+        # one key per queued row; the header row gets NO_KEY
+        keys = {
+            tab: np.concatenate([np.full(int(entry["header"]), NO_KEY, dtype=np.int64)] + entry["keys"])
+            for tab, entry in pending.items()
+        }
+        in_sync = self._check_ends(tabs)
+        blocks, needs, flushed = [], {}, {}
+        rewritten_before = {tab: len(self.rewritten.get(tab, ())) for tab in rewrites}
+        try:
+            for tab in tabs:
+                if tab not in in_sync and tab in rewrites:
+                    print(f"⚠️ {tab} doesn't end where the epoch index says; its {len(rewrites[tab])} revised rows "
+                          f"wait for the next sync (run `python caiso_sheets.py rebuild-index {tab}`).")
+                elif tab in rewrites:
+                    for row, run_keys, rows in self._rewrite_runs(rewrites[tab]):
+                        blocks.append((tab, row, 2, rows, run_keys))
+                if tab not in pending:
+                    continue
+                rows = pending[tab]["rows"]
+                if tab not in in_sync:
+                    print(f"⚠️ {tab} doesn't end where the epoch index says; appending instead "
+                          f"(run `python caiso_sheets.py rebuild-index {tab}`).")
+                    with span("values_append", tab=tab, rows=len(rows)):
+                        self.spreadsheet.values_append(
+                            _a1(tab, 1), params={"valueInputOption": self.value_input_option},
+                            body={"values": rows},
+                        )
+                    self._record(tab, keys[tab], len(rows), flushed)
+                    continue
+                start = self.index.rows(tab) + 1
+                blocks.append((tab, start, 1, rows, None))
+                needs[tab] = (start + len(rows) - 1, max(len(r) for r in rows))
+            if blocks:
+                if needs:
+                    self._grow_grids(needs)
+                for chunk in self._chunks(blocks):
+                    with span("values_batch_update", rows=sum(hi - lo for _, lo, hi in chunk)):
+                        self.spreadsheet.values_batch_update(body={
+                            "valueInputOption": self.value_input_option,
+                            "data": [
+                                {"range": _a1(tab, start + lo, col), "values": rows[lo:hi]}
+                                for (tab, start, col, rows, _), lo, hi in chunk
+                            ],
+                        })
+                    for (tab, start, _, _, run_keys), lo, hi in chunk:
+                        if run_keys is None:
+                            self._record(tab, keys[tab][lo:hi], hi - lo, flushed, first_row=start + lo)
+                        else:
+                            done = np.asarray(run_keys[lo:hi], dtype=np.int64)
+                            self.rewritten[tab] = np.concatenate([self.rewritten.get(tab, done[:0]), done])
+        except Exception:
+            # a write that failed (even after caiso_quota's retries) may still
+            # have landed in part: re-read those tabs before trusting them again
+            for tab in tabs:
+                unwritten = tab in pending and flushed.get(tab, 0) < len(pending[tab]["rows"])
+                unrewritten = tab in rewrites and tab in in_sync and (
+                    len(self.rewritten.get(tab, ())) - rewritten_before[tab] < len(rewrites[tab]))
+                if unwritten or unrewritten:
+                    self.index.invalidate(tab)
+            raise
+        finally:
+            # whatever made it into the sheet is recorded, even if a later chunk failed
+            self.index.save()
+        for tab, n in flushed.items():
+            self.written[tab] = self.written.get(tab, 0) + n
+        return flushed
+
+    def _record(self, tab, keys, n, flushed, first_row=None):
+        self.index.add(tab, keys, rows=n, first_row=first_row)
+        flushed[tab] = flushed.get(tab, 0) + n
+
+
+# --- PARTITIONED LAYOUT ---
+_PARTITION_TAB_RE = re.compile(r"^(Chart_\d+)_\d{4}_(?:\d{2}|Q[1-4])$")
+
+
+def _partition(partition):
+    partition = partition or SHEETS_PARTITION
+    if partition not in PARTITIONS:
+        raise ValueError(f"unknown sheets partition {partition!r}; expected one of {PARTITIONS}")
+    return partition
+
+
+def _period_start(day, partition):
+    if partition == "quarter":
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    return date(day.year, day.month, 1)
+
+
+def _next_period(start, partition):
+    month = start.month + (3 if partition == "quarter" else 1)
+    return date(start.year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def partition_tab(chart, start, partition):
+    """Chart_1_2025_07 (month) or Chart_1_2025_Q3 (quarter) for the period starting `start`."""
+    if partition == "quarter":
+        return f"{chart}_{start.year}_Q{(start.month - 1) // 3 + 1}"
+    return f"{chart}_{start:%Y_%m}"
+
+
+def chart_of_tab(tab):
+    """The store chart a tab holds: Chart_1_2025_07 -> Chart_1."""
+    m = _PARTITION_TAB_RE.match(tab)
+    return m.group(1) if m else tab
+
+
+def partitions(chart, keys, partition=None):
+    """
+    Split a chart's sorted epoch-ms keys by tab: [(tab, lo, hi)] so that
+    keys[lo:hi] belong in `tab`. Periods follow Pacific calendar months.
+    """
+    partition = _partition(partition)
+    if partition == "none" or not len(keys):
+        return [(chart, 0, len(keys))] if len(keys) else []
+    first = datetime.fromtimestamp(int(keys[0]) / 1000, PACIFIC).date()
+    last = datetime.fromtimestamp(int(keys[-1]) / 1000, PACIFIC).date()
+    out = []
+    start = _period_start(first, partition)
+    while start <= last:
+        nxt = _next_period(start, partition)
+        lo, hi = np.searchsorted(keys, [day_bounds_ms(start)[0], day_bounds_ms(nxt)[0]])
+        if hi > lo:
+            out.append((partition_tab(chart, start, partition), int(lo), int(hi)))
+        start = nxt
+    return out
+
+
+# --- PROJECTION OF THE LOCAL STORE ---
+def worksheet_for(spreadsheet, tab, epoch_index, rows=300, cols=10):
+    """
+    Open a Chart_N tab, creating it (and forgetting its index entry) if
+    needed. Handles are kept on the run's EpochIndex, so each tab is opened
+    once per run however many dates are synced.
+    """
+    import gspread
+
+    sheet = epoch_index.sheet(tab)
+    if sheet is not None:
+        epoch_index.ensure(sheet)
+        return sheet
+    try:
+        with span("worksheet_open", tab=tab):
+            sheet = spreadsheet.worksheet(tab)
+    except gspread.exceptions.WorksheetNotFound:
+        with span("add_worksheet", tab=tab):
+            sheet = spreadsheet.add_worksheet(title=tab, rows=str(rows), cols=str(cols))
+        epoch_index.reset(tab)
+    epoch_index.remember(tab, sheet)
+    # Only reads the tab in full the first time it's seen by the index
+    epoch_index.ensure(sheet)
+    return sheet
+
+
+def sync_from_store(store, spreadsheet, start_ms=None, end_ms=None, charts=None,
+                    value_input_option="USER_ENTERED", epoch_index=None, partition=None):
+    """
+    Bring the chart tabs up to date with the local store for [start_ms, end_ms):
+    every stored row a tab doesn't have yet is queued, every row the store
+    has revised since (caiso_store revisions) is rewritten in place, all in
+    one flush. With a partitioned layout only the partitions the range
+    touches are opened. Returns {tab: rows written}.
+    """
+    epoch_index = epoch_index or EpochIndex(spreadsheet)
+    writer = SheetWriteBuffer(spreadsheet, epoch_index, value_input_option=value_input_option)
+    settled = {}  # chart -> revised keys that were appended fresh
+    for chart in charts or store.charts():
+        with span("store_read", chart=chart) as s:
+            chart_keys, chart_values, names = store.block(chart, start_ms, end_ms)
+            revised = np.isin(chart_keys, store.revisions(chart, start_ms, end_ms))
+            s["rows"] = len(chart_keys)
+        for tab, lo, hi in partitions(chart, chart_keys, partition):
+            sheet = worksheet_for(spreadsheet, tab, epoch_index, rows=max(300, hi - lo + 1),
+                                  cols=max(10, len(names) + 1))
+            # format only the rows the tab is missing
+            missing = epoch_index.missing(tab, chart_keys[lo:hi])
+            settled.setdefault(chart, []).append(chart_keys[lo:hi][missing & revised[lo:hi]])
+            if revised[lo:hi].any():
+                _queue_rewrites(writer, epoch_index, sheet, chart_keys[lo:hi][~missing & revised[lo:hi]],
+                                chart_values[lo:hi][~missing & revised[lo:hi]])
+            keys, values = chart_keys[lo:hi][missing], chart_values[lo:hi][missing]
+            if not len(keys):
+                print(f"⏭️ {tab} already has every stored row in range.")
+                continue
+            queued = writer.add(tab, block_rows(keys, values), keys, header=["Timestamp"] + names, clean=True)
+            print(f"📝 Queued {queued} new rows for {tab}.")
+    writer.flush()
+    for chart, keys in settled.items():
+        rewritten = [k for tab, k in writer.rewritten.items() if chart_of_tab(tab) == chart]
+        store.clear_revisions(chart, np.concatenate(keys + rewritten))
+    return writer.written
+
+
+def _queue_rewrites(writer, epoch_index, sheet, keys, values):
+    """Queue in-place rewrites of revised rows the tab already has."""
+    if not len(keys):
+        return
+    rows = epoch_index.rows_of(sheet.title, keys)
+    if rows is None or not rows.all():
+        # rows written before placements were tracked: locate them once
+        epoch_index.rebuild(sheet)
+        rows = epoch_index.rows_of(sheet.title, keys)
+    placed = rows > 0
+    if not placed.all():
+        print(f"⚠️ {sheet.title}: {int((~placed).sum())} revised rows couldn't be located; "
+              f"run `python caiso_sheets.py rebuild-index {sheet.title}`.")
+    cells = [row[1:] for row in block_rows(keys[placed], values[placed])]
+    n = writer.rewrite(sheet.title, rows[placed], keys[placed], cells)
+    print(f"✏️ Queued {n} revised rows for in-place rewrite in {sheet.title}.")
+
+
+def write_rollup_tab(spreadsheet, store, tab=ROLLUP_TAB, value_input_option="USER_ENTERED"):
+    """
+    Replace the Daily_Rollup tab with the store's daily rollups: one row per
+    day, chart and series, a few thousand rows for years of data. Written
+    whole (resize + one update) since recomputed days change in place.
+    """
+    import gspread
+
+    from caiso_rollup import rollup_frame
+
+    frame = rollup_frame(store, "day").round({"energy_mwh": 3, "mean": 3})
+    values = [ROLLUP_HEADER] + [
+        sanitize_row([start[:10], chart, series, energy, lo, hi, mean, peak_time, points])
+        for start, chart, series, energy, lo, hi, mean, peak_time, points in zip(
+            frame["start"], frame["chart"], frame["series"], frame["energy_mwh"].astype(float),
+            frame["min"], frame["max"], frame["mean"], frame["peak_time"], frame["points"].astype(int),
+        )
+    ]
+    try:
+        with span("worksheet_open", tab=tab):
+            sheet = spreadsheet.worksheet(tab)
+        sheet.resize(rows=len(values), cols=len(ROLLUP_HEADER))
+    except gspread.exceptions.WorksheetNotFound:
+        with span("add_worksheet", tab=tab):
+            sheet = spreadsheet.add_worksheet(title=tab, rows=str(len(values)), cols=str(len(ROLLUP_HEADER)))
+    with span("rollup_tab_write", tab=tab, rows=len(values) - 1):
+        sheet.update("A1", values, value_input_option=value_input_option)
+    return len(values) - 1
+
+
+def import_tab_into_store(store, sheet):
+    """Seed the store from an existing chart tab (one full read). Returns points new or changed."""
+    import pandas as pd
+
+    values = sheet.get_all_values()
+    if len(values) < 2:
+        return 0
+    header, body = values[0], values[1:]
+    # the same parser the index uses: tabs mix '2025-08-07 09:05:00' and '8/7/2025 9:05:00'
+    keys = sheet_row_keys(body)
+    ok = keys != NO_KEY
+    changed = 0
+    for col, name in enumerate(header[1:], start=1):
+        if not name:
+            continue
+        cells = pd.Series([r[col] if len(r) > col else "" for r in body])
+        numbers = pd.to_numeric(cells.str.replace(",", "", regex=False), errors="coerce").to_numpy()
+        changed += store.upsert_series(chart_of_tab(sheet.title), name, keys[ok], numbers[ok])
+    return changed
+
+
+def _chart_tabs(spreadsheet):
+    return [ws for ws in spreadsheet.worksheets() if ws.title.startswith("Chart_")]
+
+
+_USAGE = """usage:
+    python caiso_sheets.py rebuild-index [TAB ...]
+    python caiso_sheets.py sync [START_DAY [END_DAY]]
+    python caiso_sheets.py import-tabs [TAB ...]"""
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command not in ("rebuild-index", "sync", "import-tabs"):
+        sys.exit(_USAGE)
+    from caiso_quota import schedule
+
+    spreadsheet = schedule(open_spreadsheet())
+    if command == "rebuild-index":
+        index = EpochIndex(spreadsheet)
+        tabs = [spreadsheet.worksheet(t) for t in sys.argv[2:]] or _chart_tabs(spreadsheet)
+        for ws in tabs:
+            entry = index.rebuild(ws)
+            print(f"🔁 {ws.title}: {entry.rows} rows, {entry.key_count} keys in {len(entry.runs)} runs")
+        index.save()
+        print("✅ Epoch index rebuilt.")
+    elif command == "sync":
+        days = [datetime.strptime(d, "%Y-%m-%d").date() for d in sys.argv[2:4]]
+        start_ms, end_ms = day_bounds_ms(*days) if days else (None, None)
+        with TimeSeriesStore() as store:
+            for tab, n in sorted(sync_from_store(store, spreadsheet, start_ms, end_ms).items()):
+                print(f"✅ Wrote {n} rows to {tab}.")
+        print("✅ Sheets are in sync with the local store.")
+    else:
+        tabs = [spreadsheet.worksheet(t) for t in sys.argv[2:]] or _chart_tabs(spreadsheet)
+        with TimeSeriesStore() as store:
+            for ws in tabs:
+                print(f"📥 {ws.title}: {import_tab_into_store(store, ws)} points new or changed")
+        print("✅ Local store seeded from Sheets.")
@@ -0,0 +1,445 @@
+"""
+Local time-series store: the system of record for every scraped point.
+
+One SQLite file (CAISO_STORE_PATH, default caiso_store.sqlite) holding
+
+    points(chart, series, epoch_ms, value)   primary key (chart, series, epoch_ms)
+    series(chart, series, position)          column order for exports
+    charts(chart, title)
+    reports(url, report_date, etag, last_modified, ingested_at)
+    rollups(period, chart, series, start_ms, points, energy_mwh, min, max, mean, peak_ms)
+    payloads(report_date, chart, series, hash)
+    revisions(chart, epoch_ms)
+
+Scrapers upsert into it first; a point that is re-scraped with a different
+value is updated in place, an identical one is a no-op. The Chart_N tabs in
+Google Sheets are a projection of this table (see caiso_sheets.sync_from_store).
+`reports` remembers the HTTP validators of every report page that was last
+ingested successfully, for the availability probe (caiso_extract.probe_report).
+`rollups` holds the hourly and daily aggregates caiso_rollup.py derives.
+
+`payloads` keeps a content hash of every (report date, chart, series) as
+it was last ingested: a republished report whose series hash the same is
+not upserted at all. When one does differ, every point it changes that was
+already stored is queued in `revisions`, so the Sheets projection rewrites
+just those cells in place (caiso_sheets.sync_from_store) and then clears them.
+
+    python caiso_store.py stats
+    python caiso_store.py query Chart_1 [--start 2025-07-01] [--end 2025-08-01] > chart_1.csv
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+PACIFIC = ZoneInfo("US/Pacific")
+STORE_PATH = os.environ.get("CAISO_STORE_PATH", "caiso_store.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    chart    TEXT    NOT NULL,
+    series   TEXT    NOT NULL,
+    epoch_ms INTEGER NOT NULL,
+    value    REAL,
+    PRIMARY KEY (chart, series, epoch_ms)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS points_by_time ON points (chart, epoch_ms);
+CREATE TABLE IF NOT EXISTS series (
+    chart    TEXT    NOT NULL,
+    series   TEXT    NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (chart, series)
+);
+CREATE TABLE IF NOT EXISTS charts (
+    chart TEXT PRIMARY KEY,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    period     TEXT    NOT NULL,
+    chart      TEXT    NOT NULL,
+    series     TEXT    NOT NULL,
+    start_ms   INTEGER NOT NULL,
+    points     INTEGER NOT NULL,
+    energy_mwh REAL,
+    min        REAL,
+    max        REAL,
+    mean       REAL,
+    peak_ms    INTEGER,
+    PRIMARY KEY (period, chart, series, start_ms)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS payloads (
+    report_date TEXT NOT NULL,
+    chart       TEXT NOT NULL,
+    series      TEXT NOT NULL,
+    hash        TEXT NOT NULL,
+    PRIMARY KEY (report_date, chart, series)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS revisions (
+    chart    TEXT    NOT NULL,
+    epoch_ms INTEGER NOT NULL,
+    PRIMARY KEY (chart, epoch_ms)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS reports (
+    url           TEXT PRIMARY KEY,
+    report_date   TEXT NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    ingested_at   TEXT NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO points (chart, series, epoch_ms, value) VALUES (?, ?, ?, ?)
+ON CONFLICT (chart, series, epoch_ms) DO UPDATE SET value = excluded.value
+WHERE points.value IS NOT excluded.value
+"""
+
+
+def chart_name(chart_index):
+    """Charts are named after the tab they have always been written to."""
+    return f"Chart_{chart_index + 1}"
+
+
+def day_bounds_ms(first_day, last_day=None):
+    """[start, end) in epoch ms covering Pacific report days first_day..last_day."""
+    last_day = last_day or first_day
+    # local midnight is never skipped or repeated in US/Pacific (DST flips at 2am)
+    start = datetime.combine(first_day, time(), tzinfo=PACIFIC)
+    end = datetime.combine(last_day + timedelta(days=1), time(), tzinfo=PACIFIC)
+    return int(start.timestamp()) * 1000, int(end.timestamp()) * 1000
+
+
+def series_hash(keys, values):
+    """sha256 of a series' int64 keys and float64 values, as normalized."""
+    h = hashlib.sha256(np.ascontiguousarray(keys, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _finite_or_none(values):
+    arr = np.asarray(values, dtype=float)
+    out = arr.astype(object)
+    out[~np.isfinite(arr)] = None
+    return out.tolist()
+
+
+def align_series(xs, ys):
+    """
+    Lay series of any lengths and timestamps onto one epoch-ms timeline.
+    Returns (keys, values): sorted distinct int64 keys and a preallocated
+    float64 [len(keys), len(xs)] block, NaN wherever a series has no point
+    or a non-finite value.
+    """
+    xs = [np.asarray(x, dtype=np.int64) for x in xs]
+    keys = np.unique(np.concatenate(xs)) if xs else np.empty(0, dtype=np.int64)
+    values = np.full((len(keys), len(xs)), np.nan)
+    for j, (x, y) in enumerate(zip(xs, ys)):
+        values[np.searchsorted(keys, x), j] = y
+    values[np.isinf(values)] = np.nan
+    return keys, values
+
+
+class TimeSeriesStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def checkpoint(self):
+        """
+        Fold the write-ahead log into the main file, so that file alone holds
+        every commit so far even if the process dies before close().
+        """
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _register(self, chart, series_names, title=None):
+        if title is not None:
+            self._conn.execute(
+                "INSERT INTO charts (chart, title) VALUES (?, ?) "
+                "ON CONFLICT (chart) DO UPDATE SET title = excluded.title",
+                (chart, title),
+            )
+        else:
+            self._conn.execute("INSERT OR IGNORE INTO charts (chart) VALUES (?)", (chart,))
+        (next_pos,) = self._conn.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM series WHERE chart = ?", (chart,)
+        ).fetchone()
+        for name in series_names:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO series (chart, series, position) VALUES (?, ?, ?)",
+                (chart, name, next_pos),
+            )
+            next_pos += cur.rowcount
+
+    def _upsert(self, chart, series, keys, values):
+        before = self._conn.total_changes
+        self._conn.executemany(
+            _UPSERT,
+            zip([chart] * len(keys), [series] * len(keys), np.asarray(keys, dtype=np.int64).tolist(), _finite_or_none(values)),
+        )
+        return self._conn.total_changes - before
+
+    def upsert_series(self, chart, series, keys, values, title=None):
+        """Insert or update one series. Returns how many points were new or changed."""
+        with self._conn:
+            self._register(chart, [series], title)
+            return self._upsert(chart, series, keys, values)
+
+    def _queue_revisions(self, chart, series, keys, values):
+        """Queue the already-stored points of `series` whose value is about to change."""
+        keys = np.asarray(keys, dtype=np.int64)
+        rows = self._conn.execute(
+            "SELECT epoch_ms, value FROM points WHERE chart = ? AND series = ? AND epoch_ms BETWEEN ? AND ?",
+            (chart, series, int(keys.min()), int(keys.max())),
+        ).fetchall()
+        if not rows:
+            return 0
+        old = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        new = np.asarray(values, dtype=np.float64)
+        new = np.where(np.isfinite(new), new, np.nan)  # stored as NULL
+        _, i_old, i_new = np.intersect1d(old[:, 0].astype(np.int64), keys, return_indices=True)
+        a, b = old[i_old, 1], new[i_new]
+        revised = keys[i_new][~((a == b) | (np.isnan(a) & np.isnan(b)))]
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO revisions (chart, epoch_ms) VALUES (?, ?)",
+            zip([chart] * len(revised), revised.tolist()),
+        )
+        return len(revised)
+
+    def upsert_chart_data(self, chart_data, report_date=None):
+        """
+        Store a report's chart_data ([{"title", "series": [{"name", "x", "y"}]}]).
+        Returns {chart name: points new or changed}; charts without data are left out.
+
+        With `report_date`, series whose payload hashes the same as at the
+        last ingest of that date are skipped, and already-stored points a
+        changed series corrects are queued as revisions.
+        """
+        changed = {}
+        with self._conn:
+            known = self.payload_hashes(report_date) if report_date else {}
+            for chart_index, chart in enumerate(chart_data):
+                series_list = [s for s in chart.get("series") or [] if s.get("x") is not None and len(s["x"])]
+                if not series_list:
+                    continue
+                name = chart_name(chart_index)
+                self._register(name, [s["name"] for s in series_list], chart.get("title"))
+                changed[name] = 0
+                for s in series_list:
+                    if report_date is None:
+                        changed[name] += self._upsert(name, s["name"], s["x"], s["y"])
+                        continue
+                    digest = series_hash(s["x"], s["y"])
+                    if known.get((name, s["name"])) == digest:
+                        continue
+                    self._queue_revisions(name, s["name"], s["x"], s["y"])
+                    changed[name] += self._upsert(name, s["name"], s["x"], s["y"])
+                    self._conn.execute(
+                        "INSERT INTO payloads (report_date, chart, series, hash) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (report_date, chart, series) DO UPDATE SET hash = excluded.hash",
+                        (report_date.isoformat(), name, s["name"], digest),
+                    )
+        return changed
+
+    def payload_hashes(self, report_date):
+        """{(chart, series): hash} of the payloads last ingested for a report date."""
+        rows = self._conn.execute(
+            "SELECT chart, series, hash FROM payloads WHERE report_date = ?", (report_date.isoformat(),)
+        ).fetchall()
+        return {(chart, series): digest for chart, series, digest in rows}
+
+    def revisions(self, chart, start_ms=None, end_ms=None):
+        """Sorted epoch-ms keys of a chart whose stored values changed since the tabs got them."""
+        rows = self._conn.execute(
+            "SELECT epoch_ms FROM revisions WHERE chart = ? AND epoch_ms BETWEEN ? AND ? ORDER BY epoch_ms",
+            (chart, *self._range(start_ms, end_ms)),
+        ).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+    def clear_revisions(self, chart, keys):
+        """Drop revisions that have been written through to the tabs."""
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM revisions WHERE chart = ? AND epoch_ms = ?",
+                zip([chart] * len(keys), np.asarray(keys, dtype=np.int64).tolist()),
+            )
+
+    def record_report(self, url, report_date, etag=None, last_modified=None):
+        """Remember the validators a report page had when it was last ingested."""
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO reports (url, report_date, etag, last_modified, ingested_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+                "ingested_at = excluded.ingested_at",
+                (url, report_date.isoformat(), etag, last_modified,
+                 datetime.now(timezone.utc).isoformat(timespec="seconds")),
+            )
+
+    def report_validators(self):
+        """{url: (etag, last_modified)} for every report ingested so far."""
+        rows = self._conn.execute("SELECT url, etag, last_modified FROM reports").fetchall()
+        return {url: (etag, last_modified) for url, etag, last_modified in rows}
+
+    def replace_rollups(self, period, chart, start_ms, end_ms, rows):
+        """
+        Swap a chart's `period` rollups in [start_ms, end_ms) for `rows`
+        ((series, start_ms, points, energy_mwh, min, max, mean, peak_ms) tuples).
+        """
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM rollups WHERE period = ? AND chart = ? AND start_ms BETWEEN ? AND ?",
+                (period, chart, *self._range(start_ms, end_ms)),
+            )
+            self._conn.executemany(
+                "INSERT INTO rollups (period, chart, series, start_ms, points, energy_mwh, min, max, mean, peak_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((period, chart, *row) for row in rows),
+            )
+
+    def rollups(self, period, chart=None, start_ms=None, end_ms=None):
+        """Rollup rows as (chart, series, start_ms, points, energy_mwh, min, max, mean, peak_ms), in time order."""
+        sql = ("SELECT chart, series, start_ms, points, energy_mwh, min, max, mean, peak_ms FROM rollups "
+               "WHERE period = ? AND start_ms BETWEEN ? AND ?")
+        params = [period, *self._range(start_ms, end_ms)]
+        if chart is not None:
+            sql += " AND chart = ?"
+            params.append(chart)
+        return self._conn.execute(sql + " ORDER BY start_ms, chart, series", params).fetchall()
+
+    def chart_title(self, chart):
+        row = self._conn.execute("SELECT title FROM charts WHERE chart = ?", (chart,)).fetchone()
+        return row[0] if row else None
+
+    def charts(self):
+        rows = self._conn.execute("SELECT chart FROM charts").fetchall()
+        return sorted((r[0] for r in rows), key=lambda c: (len(c), c))
+
+    def series_names(self, chart):
+        rows = self._conn.execute(
+            "SELECT series FROM series WHERE chart = ? ORDER BY position", (chart,)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    @staticmethod
+    def _range(start_ms, end_ms):
+        return (
+            np.iinfo(np.int64).min if start_ms is None else int(start_ms),
+            np.iinfo(np.int64).max if end_ms is None else int(end_ms) - 1,
+        )
+
+    def keys(self, chart, start_ms=None, end_ms=None):
+        """Sorted distinct epoch-ms keys stored for a chart in [start_ms, end_ms)."""
+        rows = self._conn.execute(
+            "SELECT DISTINCT epoch_ms FROM points WHERE chart = ? AND epoch_ms BETWEEN ? AND ? ORDER BY epoch_ms",
+            (chart, *self._range(start_ms, end_ms)),
+        ).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+    def series_keys(self, chart, start_ms=None, end_ms=None):
+        """{series: sorted epoch-ms keys stored for it} for a chart in [start_ms, end_ms)."""
+        out = {}
+        for name in self.series_names(chart):
+            rows = self._conn.execute(
+                "SELECT epoch_ms FROM points WHERE chart = ? AND series = ? AND epoch_ms BETWEEN ? AND ?",
+                (chart, name, *self._range(start_ms, end_ms)),
+            ).fetchall()
+            out[name] = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        return out
+
+    def block(self, chart, start_ms=None, end_ms=None):
+        """
+        One chart as (keys, values, series names): int64 epoch-ms keys and a
+        float64 [keys, series] array from align_series, NaN where empty.
+        """
+        columns = self.series_names(chart)
+        xs, ys = [], []
+        for name in columns:
+            # primary-key order: one range scan per series, already sorted
+            rows = self._conn.execute(
+                "SELECT epoch_ms, value FROM points WHERE chart = ? AND series = ? AND epoch_ms BETWEEN ? AND ?",
+                (chart, name, *self._range(start_ms, end_ms)),
+            ).fetchall()
+            pairs = np.array(rows, dtype=np.float64).reshape(-1, 2)  # NULL -> NaN
+            xs.append(pairs[:, 0].astype(np.int64))
+            ys.append(pairs[:, 1])
+        keys, values = align_series(xs, ys)
+        return keys, values, columns
+
+    def frame(self, chart, start_ms=None, end_ms=None):
+        """One chart as a wide frame: epoch-ms index, one float column per series."""
+        import pandas as pd
+
+        keys, values, columns = self.block(chart, start_ms, end_ms)
+        return pd.DataFrame(values, index=pd.Index(keys, name="epoch_ms"), columns=columns, copy=False)
+
+    def stats(self):
+        return self._conn.execute(
+            "SELECT chart, COUNT(DISTINCT series), COUNT(*), MIN(epoch_ms), MAX(epoch_ms) "
+            "FROM points GROUP BY chart"
+        ).fetchall()
+
+
+def store_chart_data(store, chart_data, report_date=None):
+    """Upsert a report into the store and say what changed per chart."""
+    stored = store.upsert_chart_data(chart_data, report_date)
+    for chart_index in range(len(chart_data)):
+        name = chart_name(chart_index)
+        if name not in stored:
+            print(f"⚠️ {name} had no data. Skipping.")
+        elif stored[name]:
+            print(f"💾 Stored {stored[name]} new or changed points for {name}.")
+        else:
+            print(f"⏭️ {name} unchanged — already in the local store.")
+    return stored
+
+
+def local_timestamps(keys):
+    """Epoch ms -> naive Pacific "YYYY-MM-DD HH:MM:SS" strings, as the tabs show them."""
+    import pandas as pd
+
+    ts = pd.to_datetime(np.asarray(keys, dtype=np.int64), unit="ms", utc=True)
+    return ts.tz_convert("US/Pacific").tz_localize(None).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the local CAISO time-series store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Points and date span per chart")
+    query = sub.add_parser("query", help="Write one chart as CSV to stdout")
+    query.add_argument("chart", help="e.g. Chart_1")
+    query.add_argument("--start", type=_parse_day, help="First Pacific day (YYYY-MM-DD)")
+    query.add_argument("--end", type=_parse_day, help="Day after the last one (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    store = TimeSeriesStore()
+    if args.command == "stats":
+        for chart, n_series, n_points, lo, hi in store.stats():
+            first, last = local_timestamps([lo, hi])
+            print(f"📦 {chart}: {n_series} series, {n_points} points, {first} → {last}")
+    else:
+        start_ms = day_bounds_ms(args.start)[0] if args.start else None
+        end_ms = day_bounds_ms(args.end)[0] if args.end else None
+        wide = store.frame(args.chart, start_ms, end_ms)
+        wide.insert(0, "Timestamp", local_timestamps(wide.index))
+        wide.to_csv(sys.stdout, index=False)
+    store.close()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules live at the repo root; keep timing spans out of the working tree
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CAISO_SPANS_PATH", "")
+os.environ.setdefault("CAISO_CACHE", "0")
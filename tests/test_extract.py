@@ -0,0 +1,68 @@
+import os
+from datetime import date
+
+import pytest
+
+import caiso_extract
+from caiso_extract import ChartParseError, parse_highcharts_html
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+JUL_1_2025_0700_UTC = 1751353200000
+JAN_1_2025_UTC = 1735689600000
+FIVE_MIN = 300_000
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_point_start_and_interval():
+    (chart,) = parse_highcharts_html(_fixture("point_interval.html"))
+    assert chart["title"] == "Batteries Trend"
+    charging, discharging = chart["series"]
+    assert charging["name"] == "Charging"
+    assert charging["x"] == [JUL_1_2025_0700_UTC + i * FIVE_MIN for i in range(4)]
+    assert charging["y"] == [1.5, -2, None, 16]
+    # a series' own pointStart wins over plotOptions; the interval still comes from there
+    assert discharging["name"] == "Discharging"
+    assert discharging["x"] == [1767225300000, 1767225300000 + FIVE_MIN]
+    assert discharging["y"] == [4, 52.5]
+
+
+def test_xy_pairs_and_date_utc():
+    first, second = parse_highcharts_html(_fixture("xy_pairs.html"))
+    assert first["title"] == 'Net & "Hybrid"'
+    (net,) = first["series"]
+    # Date.UTC months are 0-based and month 12 rolls over into the next year
+    assert net["x"] == [JAN_1_2025_UTC, JAN_1_2025_UTC + FIVE_MIN, JAN_1_2025_UTC + 2 * FIVE_MIN]
+    assert net["y"] == [10, 12.5, None]
+    assert second == {"title": "Second chart", "series": [{"name": "Only", "x": [JAN_1_2025_UTC], "y": [-1]}]}
+
+
+def test_variable_references():
+    (chart,) = parse_highcharts_html(_fixture("references.html"))
+    assert chart["title"] == "By reference"
+    (series,) = chart["series"]
+    assert series["x"] == [JUL_1_2025_0700_UTC + i * FIVE_MIN for i in range(3)]
+    assert series["y"] == [1, 2, 3]
+
+
+@pytest.mark.parametrize("name, message", [
+    ("regex_literal.html", "can't evaluate JS expression"),
+    ("no_chart.html", "no Highcharts configs found"),
+])
+def test_unparseable_pages_raise(name, message):
+    with pytest.raises(ChartParseError, match=message):
+        parse_highcharts_html(_fixture(name))
+
+
+def test_parse_error_falls_back_to_selenium(monkeypatch):
+    browser_data = [{"title": "From the browser", "series": []}]
+    monkeypatch.setattr(caiso_extract, "fetch_report_html", lambda url, timeout=30: _fixture("regex_literal.html"))
+    monkeypatch.setattr(caiso_extract, "_scrape_with_browser", lambda url, driver=None, pool=None: browser_data)
+    day = date(2025, 7, 1)
+    assert caiso_extract.fetch_chart_data(day, mode="auto", use_cache=False) is browser_data
+    with pytest.raises(ChartParseError):
+        caiso_extract.fetch_chart_data(day, mode="http", use_cache=False)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from caiso_sheets import import_tab_into_store, sheet_row_keys
+from caiso_store import TimeSeriesStore
+
+
+class _Tab:
+    def __init__(self, title, values):
+        self.title = title
+        self._values = values
+
+    def get_all_values(self):
+        return self._values
+
+
+def test_import_tabs_reads_mixed_timestamp_formats(tmp_path):
+    # what a tab looks like once USER_ENTERED rows came back as Sheets dates
+    rows = [
+        ["Timestamp", "Charging"],
+        ["2025-08-07 09:05:00", "1"],
+        ["8/7/2025 9:10:00", "1,200.5"],
+        ["8/7/2025 9:15", "3"],
+        ["not a time", "4"],
+    ]
+    keys = sheet_row_keys(rows[1:])
+    assert np.all(np.diff(keys[:3]) == 300_000)
+    with TimeSeriesStore(str(tmp_path / "store.sqlite")) as store:
+        assert import_tab_into_store(store, _Tab("Chart_1", rows)) == 3
+        stored_keys, values, names = store.block("Chart_1")
+    assert names == ["Charging"]
+    assert stored_keys.tolist() == keys[:3].tolist()
+    assert values[:, 0].tolist() == [1.0, 1200.5, 3.0]
+
+
+def test_daily_placements_merge_into_one_run():
+    from caiso_sheets import _TabIndex
+
+    entry = _TabIndex(placed=[])
+    start, step = 1735689600000, 300_000
+    for day in range(30):
+        keys = start + step * (day * 288 + np.arange(288))
+        entry.add(keys)
+        entry.place(keys, 2 + day * 288)
+    assert entry.placed == [[2, start, step, 30 * 288]]
+    assert entry.rows_of([start, start + step * 1000]).tolist() == [2, 1002]